@@ -15,11 +15,14 @@
 ####################
 # Imports
 import sys
-from hardware import SIM900
-from visa import *
+from fridge import CooldownEngine, Settings
+from fridge.clock import MonotonicClock, ScaledClock
+from fridge.samples import open_heaters
+from fridge.decimate import DecimatedHistory
+from hardware.instrument import ResourceManager
 from PyQt5 import QtGui, QtCore, QtWidgets
-import csv
 import time
+import math
 ####################
 
 ####################
@@ -30,28 +33,32 @@ class MainWindow(QtWidgets.QMainWindow): #Master object
         self.setWindowIcon(QtGui.QIcon('snow.ico'))
         self.central_widget = QtWidgets.QStackedWidget()
         self.setCentralWidget(self.central_widget)
-        self.rm = ResourceManager()
+        #python cooldown.py --simulate [--speed N] lists the simulated GL4 (simulator/) instead of the real instruments,
+        #running N times faster than real time
+        #--speed would speed up the real control loop too (heater ramps, waits, sampling), so it is only for the simulator
+        if '--speed' in sys.argv and '--simulate' not in sys.argv:
+            sys.exit('--speed needs --simulate')
+        self.clock = MonotonicClock()
+        if '--simulate' in sys.argv:
+            from simulator import SimulatedResourceManager
+            speed = float(sys.argv[sys.argv.index('--speed')+1]) if '--speed' in sys.argv else 1.0
+            if speed != 1.0:
+                self.clock = ScaledClock(speed)
+            self.rm = SimulatedResourceManager(clock=self.clock)
+        elif ResourceManager is None:
+            sys.exit('PyVisa is required to talk to the instruments (pip install pyvisa), or run python cooldown.py --simulate')
+        else:
+            self.rm = ResourceManager()
         dev_setup_widget = DevSetup(self)
         self.central_widget.addWidget(dev_setup_widget)
-        #Below are editable in the settings menu
-        #SIM900 Slots
-        self.ACBridgeSlot='5'
-        self.ThermSlot1='8'
-        #For logging
-        self.log_file = "temp_log.txt"
-        self.logging = False
-        #Thresholds to tinker with
-        self.CDStage1_ThHold = 4.2
-        self.CDStage1_Pump_lower_temp = 45.0
+        #Below are editable in the settings menu, see fridge/settings.py for what they all do
+        self.settings = Settings()
+        #the cooldown itself runs in the engine, this window just drives it and shows what it is doing (python -m fridge runs it without a display)
+        self.engine = CooldownEngine(self.settings, self.clock)
         #timer if desired
         self.timer_on='hh:mm:ss'
         self.timer = False
 
-        #Master counters and things
-        self.current_pump_temp=''
-        self.current_head_temp=''
-        self.head_repeat_temps=0
-
         #Add menubar
         mainMenu=self.menuBar()
         settingsMenu=mainMenu.addMenu('Settings')
@@ -59,10 +66,8 @@ class MainWindow(QtWidgets.QMainWindow): #Master object
         settingsButton.triggered.connect(self.change_settings)
         settingsMenu.addAction(settingsButton)
 
-    def confirm_devs(self, Keithley_add, SIM900_add): #Confirms the device choices and opens the devices for use under the Master object, then switches views to the cooldown view
-        self.Keithley = self.rm.open_resource(Keithley_add)
-        self.Keithley.write("SYSTEM:REMOTE") #needed to work on pi/linux 
-        self.SIM900 = SIM900(SIM900_add)
+    def confirm_devs(self, Keithley_add, SIM900_add): #Confirms the device choices and opens the devices for use by the engine, then switches views to the cooldown view
+        self.engine.open_devices(Keithley_add, SIM900_add, self.rm)
         cooldown_widget = Cooldown(self)
         self.central_widget.addWidget(cooldown_widget)
         self.central_widget.setCurrentWidget(cooldown_widget)
@@ -84,14 +89,14 @@ class SettingsPage(QtWidgets.QWidget): #Settings page accessed from the menubar.
         self.CDStage1_ThHold_lbl.setAlignment(QtCore.Qt.AlignCenter)
         self.grid.addWidget(self.CDStage1_ThHold_lbl, 0,0)
         self.CDStage1_ThHold_entry=QtWidgets.QLineEdit(self)
-        self.CDStage1_ThHold_entry.setText(str(Master.CDStage1_ThHold))
+        self.CDStage1_ThHold_entry.setText(str(Master.settings.CDStage1_ThHold))
         self.grid.addWidget(self.CDStage1_ThHold_entry, 0,1)
 
         self.CDStage1_Pump_lower_temp_lbl=QtWidgets.QLabel(self, text='Set lower bound for pump temp before Stage 2:')
         self.CDStage1_Pump_lower_temp_lbl.setAlignment(QtCore.Qt.AlignCenter)
         self.grid.addWidget(self.CDStage1_Pump_lower_temp_lbl, 1,0)
         self.CDStage1_Pump_lower_temp_entry=QtWidgets.QLineEdit(self)
-        self.CDStage1_Pump_lower_temp_entry.setText(str(Master.CDStage1_Pump_lower_temp))
+        self.CDStage1_Pump_lower_temp_entry.setText(str(Master.settings.CDStage1_Pump_lower_temp))
         self.grid.addWidget(self.CDStage1_Pump_lower_temp_entry, 1,1)
 
         self.logging_choice=QtWidgets.QCheckBox(self, text='Enable logging of temperatures?')
@@ -101,7 +106,7 @@ class SettingsPage(QtWidgets.QWidget): #Settings page accessed from the menubar.
         self.logging_file_lbl.setAlignment(QtCore.Qt.AlignCenter)
         self.grid.addWidget(self.logging_file_lbl, 3,0)
         self.logging_file_entry=QtWidgets.QLineEdit(self)
-        self.logging_file_entry.setText(str(Master.log_file))
+        self.logging_file_entry.setText(str(Master.settings.log_file))
         self.grid.addWidget(self.logging_file_entry, 3,1)
 
         self.timer_choice=QtWidgets.QCheckBox(self, text='Schedule cooldown?')
@@ -113,22 +118,134 @@ class SettingsPage(QtWidgets.QWidget): #Settings page accessed from the menubar.
         self.timer_on_entry.setText(str(Master.timer_on))
         self.grid.addWidget(self.timer_on_entry, 5,1)
 
+        self.sensor_map_lbl=QtWidgets.QLabel(self, text='Sensor map file (blank for default):')
+        self.sensor_map_lbl.setAlignment(QtCore.Qt.AlignCenter)
+        self.grid.addWidget(self.sensor_map_lbl, 6,0)
+        self.sensor_map_entry=QtWidgets.QLineEdit(self)
+        self.sensor_map_entry.setText(str(Master.settings.sensor_map_file))
+        self.grid.addWidget(self.sensor_map_entry, 6,1)
+
+        self.port_mode_choice=QtWidgets.QCheckBox(self, text='Read SIM900 modules through port buffers?')
+        self.port_mode_choice.setChecked(Master.settings.SIM900_mode == 'port')
+        self.grid.addWidget(self.port_mode_choice, 7,0)
+
+        self.sample_period_lbl=QtWidgets.QLabel(self, text='Sample period (s):')
+        self.sample_period_lbl.setAlignment(QtCore.Qt.AlignCenter)
+        self.grid.addWidget(self.sample_period_lbl, 8,0)
+        self.sample_period_entry=QtWidgets.QLineEdit(self)
+        self.sample_period_entry.setText(str(Master.settings.sample_period))
+        self.grid.addWidget(self.sample_period_entry, 8,1)
+
+        self.slow_sample_period_lbl=QtWidgets.QLabel(self, text='Slowest sample period for flat sensors (s):')
+        self.slow_sample_period_lbl.setAlignment(QtCore.Qt.AlignCenter)
+        self.grid.addWidget(self.slow_sample_period_lbl, 9,0)
+        self.slow_sample_period_entry=QtWidgets.QLineEdit(self)
+        self.slow_sample_period_entry.setText(str(Master.settings.slow_sample_period))
+        self.grid.addWidget(self.slow_sample_period_entry, 9,1)
+
+        self.log_per_run_choice=QtWidgets.QCheckBox(self, text='New log file for each cooldown?')
+        self.log_per_run_choice.setChecked(Master.settings.log_per_run)
+        self.grid.addWidget(self.log_per_run_choice, 10,0)
+
+        self.log_rotate_lbl=QtWidgets.QLabel(self, text='Start a new log file after (MB, 0 for never):')
+        self.log_rotate_lbl.setAlignment(QtCore.Qt.AlignCenter)
+        self.grid.addWidget(self.log_rotate_lbl, 11,0)
+        self.log_rotate_entry=QtWidgets.QLineEdit(self)
+        self.log_rotate_entry.setText(str(Master.settings.log_rotate_mb))
+        self.grid.addWidget(self.log_rotate_entry, 11,1)
+
+        self.log_fsync_lbl=QtWidgets.QLabel(self, text='Sync log to disk:')
+        self.log_fsync_lbl.setAlignment(QtCore.Qt.AlignCenter)
+        self.grid.addWidget(self.log_fsync_lbl, 12,0)
+        self.log_fsync_opt=QtWidgets.QComboBox(self)
+        for i in ['never', 'flush', 'close']:
+            self.log_fsync_opt.addItem(i)
+        self.log_fsync_opt.setCurrentText(Master.settings.log_fsync)
+        self.grid.addWidget(self.log_fsync_opt, 12,1)
+
+        self.log_format_lbl=QtWidgets.QLabel(self, text='Log format:')
+        self.log_format_lbl.setAlignment(QtCore.Qt.AlignCenter)
+        self.grid.addWidget(self.log_format_lbl, 13,0)
+        self.log_format_opt=QtWidgets.QComboBox(self)
+        for i in ['csv', 'binary']:
+            self.log_format_opt.addItem(i)
+        self.log_format_opt.setCurrentText(Master.settings.log_format)
+        self.grid.addWidget(self.log_format_opt, 13,1)
+
+        self.plot_history_lbl=QtWidgets.QLabel(self, text='Plot samples per level of detail:')
+        self.plot_history_lbl.setAlignment(QtCore.Qt.AlignCenter)
+        self.grid.addWidget(self.plot_history_lbl, 14,0)
+        self.plot_history_entry=QtWidgets.QLineEdit(self)
+        self.plot_history_entry.setText(str(Master.settings.plot_history))
+        self.grid.addWidget(self.plot_history_entry, 14,1)
+
+        self.heater_readback_lbl=QtWidgets.QLabel(self, text='Heater read back period (s, 0 = off):')
+        self.heater_readback_lbl.setAlignment(QtCore.Qt.AlignCenter)
+        self.grid.addWidget(self.heater_readback_lbl, 15,0)
+        self.heater_readback_entry=QtWidgets.QLineEdit(self)
+        self.heater_readback_entry.setText(str(Master.settings.heater_readback_period))
+        self.grid.addWidget(self.heater_readback_entry, 15,1)
+
+        self.recipe_lbl=QtWidgets.QLabel(self, text='Cooldown recipe file (blank for GL4):')
+        self.recipe_lbl.setAlignment(QtCore.Qt.AlignCenter)
+        self.grid.addWidget(self.recipe_lbl, 16,0)
+        self.recipe_entry=QtWidgets.QLineEdit(self)
+        self.recipe_entry.setText(str(Master.settings.recipe_file))
+        self.grid.addWidget(self.recipe_entry, 16,1)
+
+        self.pid_setpoint_lbl=QtWidgets.QLabel(self, text='Stage 1 pump setpoint (K):')
+        self.pid_setpoint_lbl.setAlignment(QtCore.Qt.AlignCenter)
+        self.grid.addWidget(self.pid_setpoint_lbl, 17,0)
+        self.pid_setpoint_entry=QtWidgets.QLineEdit(self)
+        self.pid_setpoint_entry.setText(str(Master.settings.pid_setpoint))
+        self.grid.addWidget(self.pid_setpoint_entry, 17,1)
+
+        self.pid_gains_lbl=QtWidgets.QLabel(self, text='Pump PID gains kp, ki, kd (W/K):')
+        self.pid_gains_lbl.setAlignment(QtCore.Qt.AlignCenter)
+        self.grid.addWidget(self.pid_gains_lbl, 18,0)
+        self.pid_gains_entry=QtWidgets.QLineEdit(self)
+        self.pid_gains_entry.setText('{}, {}, {}'.format(Master.settings.pid_kp, Master.settings.pid_ki, Master.settings.pid_kd))
+        self.grid.addWidget(self.pid_gains_entry, 18,1)
+
+        self.pid_log_lbl=QtWidgets.QLabel(self, text='PID tuning log file (blank for none):')
+        self.pid_log_lbl.setAlignment(QtCore.Qt.AlignCenter)
+        self.grid.addWidget(self.pid_log_lbl, 19,0)
+        self.pid_log_entry=QtWidgets.QLineEdit(self)
+        self.pid_log_entry.setText(str(Master.settings.pid_log_file))
+        self.grid.addWidget(self.pid_log_entry, 19,1)
+
         conf_butt = QtWidgets.QPushButton('Confirm', self)
         conf_butt.clicked.connect(lambda: self.confirm_and_close())
-        self.grid.addWidget(conf_butt, 6,1)
+        self.grid.addWidget(conf_butt, 20,1)
 
 
     def confirm_and_close(self): #Confirms setting selections, updates master and closes the window
-        Master.CDStage1_ThHold = float(self.CDStage1_ThHold_entry.text())
-        Master.CDStage1_Pump_lower_temp = float(self.CDStage1_Pump_lower_temp_entry.text())
+        Master.settings.CDStage1_ThHold = float(self.CDStage1_ThHold_entry.text())
+        Master.settings.CDStage1_Pump_lower_temp = float(self.CDStage1_Pump_lower_temp_entry.text())
+        Master.settings.sensor_map_file = str(self.sensor_map_entry.text())
+        Master.settings.sample_period = float(self.sample_period_entry.text())
+        Master.settings.slow_sample_period = max(float(self.slow_sample_period_entry.text()), Master.settings.sample_period)
+        Master.settings.SIM900_mode = 'port' if self.port_mode_choice.isChecked() else 'conn'
         if self.logging_choice.isChecked() == True:
-            Master.logging = True
-            Master.log_file = str(self.logging_file_entry.text())
+            Master.settings.logging = True
+            Master.settings.log_file = str(self.logging_file_entry.text())
+        Master.settings.log_per_run = self.log_per_run_choice.isChecked()
+        Master.settings.log_rotate_mb = float(self.log_rotate_entry.text())
+        Master.settings.log_fsync = str(self.log_fsync_opt.currentText())
+        Master.settings.log_format = str(self.log_format_opt.currentText())
+        Master.settings.plot_history = int(self.plot_history_entry.text())
+        Master.settings.heater_readback_period = float(self.heater_readback_entry.text())
+        Master.settings.recipe_file = str(self.recipe_entry.text()) #read when the next cooldown starts
+        #the PID settings are picked up when the next pid step starts
+        Master.settings.pid_setpoint = float(self.pid_setpoint_entry.text())
+        Master.settings.pid_kp, Master.settings.pid_ki, Master.settings.pid_kd = [float(gain) for gain in self.pid_gains_entry.text().split(',')]
+        Master.settings.pid_log_file = str(self.pid_log_entry.text())
         if self.timer_choice.isChecked() == True:
             Master.timer = True
             Master.timer_on = str(self.timer_on_entry.text())
         else:
             pass
+        Master.engine.settings_changed()
         self.destroy()
 
 class DevSetup(QtWidgets.QWidget): #Launch page where devices are defined from available list
@@ -187,12 +304,18 @@ class DevSetup(QtWidgets.QWidget): #Launch page where devices are defined from a
 class Cooldown(QtWidgets.QWidget): #Cooldown page
     def __init__(self, parent=None):
         super(Cooldown, self).__init__(parent)
-        self.parent().setGeometry(50, 50, 350, 200)
+        self.parent().setGeometry(50, 50, 780, 460)
         self.parent().setWindowTitle('Cooldown')
         self.grid = QtWidgets.QGridLayout()
         self.setLayout(self.grid)
-        self.Stage1 = False
-        self.Stage2 = False
+        #samples come in on the engine's sampler thread, the signal hands them over to the GUI thread
+        self.relay = SampleRelay()
+        self.relay.sample_sig.connect(self.update_GUI)
+        Master.engine.listeners.append(self.relay.sample_sig.emit)
+        #as does an error that has stopped the cooldown (the engine has already turned the heaters off)
+        self.relay.error_sig.connect(self.engine_failed)
+        Master.engine.error_listeners.append(self.relay.error_sig.emit)
+        self.history = None
 
         ###Temperatures###
 
@@ -250,8 +373,9 @@ class Cooldown(QtWidgets.QWidget): #Cooldown page
         self.stop_butt.clicked.connect(self.stop_cooldown)
         self.grid.addWidget(self.stop_butt, 2,0,1,2)
 
-        self.start_stage2_butt=QtWidgets.QPushButton('Jump to stage 2', self)
-        self.start_stage2_butt.clicked.connect(lambda: self.jump_to_stage_2())
+        self.start_stage2_butt=QtWidgets.QPushButton('Jump to next stage', self)
+        self.start_stage2_butt.setEnabled(False) #only while there is a next stage to jump to, see update_GUI
+        self.start_stage2_butt.clicked.connect(lambda: self.jump_to_next_stage())
         self.grid.addWidget(self.start_stage2_butt, 3,0,1,2)
 
 
@@ -275,6 +399,47 @@ class Cooldown(QtWidgets.QWidget): #Cooldown page
         self.el_time.setFrameShadow(QtWidgets.QFrame.Sunken)
         self.grid.addWidget(self.el_time, 6,1)
 
+        self.switches_lbl=QtWidgets.QLabel(self, text='Slot switches/cycle:')
+        self.grid.addWidget(self.switches_lbl, 7,0)
+        self.switches_val=QtWidgets.QLabel(self, text='0')
+        self.switches_val.setFrameShape(QtWidgets.QFrame.Panel)
+        self.switches_val.setFrameShadow(QtWidgets.QFrame.Sunken)
+        self.grid.addWidget(self.switches_val, 7,1)
+
+        self.timing_lbl=QtWidgets.QLabel(self, text='Sample timing:')
+        self.grid.addWidget(self.timing_lbl, 8,0)
+        self.timing_val=QtWidgets.QLabel(self, text='')
+        self.timing_val.setFrameShape(QtWidgets.QFrame.Panel)
+        self.timing_val.setFrameShadow(QtWidgets.QFrame.Sunken)
+        self.grid.addWidget(self.timing_val, 8,1)
+
+        self.log_lbl=QtWidgets.QLabel(self, text='Log:')
+        self.grid.addWidget(self.log_lbl, 9,0)
+        self.log_val=QtWidgets.QLabel(self, text='off')
+        self.log_val.setFrameShape(QtWidgets.QFrame.Panel)
+        self.log_val.setFrameShadow(QtWidgets.QFrame.Sunken)
+        self.grid.addWidget(self.log_val, 9,1)
+
+        self.io_lbl=QtWidgets.QLabel(self, text='Keithley worst I/O latency:')
+        self.grid.addWidget(self.io_lbl, 10,0)
+        self.io_val=QtWidgets.QLabel(self, text='')
+        self.io_val.setFrameShape(QtWidgets.QFrame.Panel)
+        self.io_val.setFrameShadow(QtWidgets.QFrame.Sunken)
+        self.grid.addWidget(self.io_val, 10,1,1,3)
+
+        self.heater_lbl=QtWidgets.QLabel(self, text='Heaters:')
+        self.grid.addWidget(self.heater_lbl, 11,0)
+        self.heater_val=QtWidgets.QLabel(self, text='')
+        self.heater_val.setFrameShape(QtWidgets.QFrame.Panel)
+        self.heater_val.setFrameShadow(QtWidgets.QFrame.Sunken)
+        self.grid.addWidget(self.heater_val, 11,1,1,3)
+
+        ###PLOT###
+
+        self.plot = LivePlot(self)
+        self.grid.addWidget(self.plot, 12,0,1,4)
+        self.grid.setRowStretch(12, 1)
+
     def begin_cooldown(self): #Kicks off temperature monitoring and 
         if Master.timer == True:
             if Master.timer_on == 'hh:mm:ss':
@@ -287,216 +452,176 @@ class Cooldown(QtWidgets.QWidget): #Cooldown page
                 Master.timer = False
                 self.begin_cooldown() 
             else:
-                time_now=time.ctime()[11:19]
-                time_now_s=(int(time_now[0:2])*3600)+(int(time_now[3:5])*60)+(int(time_now[6:8]))
+                clock = Master.engine.clock #the time of day on the engine's clock, which runs faster when simulating
+                time_now=time.localtime(clock.wall())
+                time_now_s=(time_now.tm_hour*3600)+(time_now.tm_min*60)+time_now.tm_sec
                 time_turn_on_s = (int(Master.timer_on[0:2])*3600)+(int(Master.timer_on[3:5])*60)+(int(Master.timer_on[6:8]))
-                if time_turn_on_s < time_now:
-                    wait_time=(86400-time_now)+time_turn_on_s #86400=seconds in day
-                else:
-                    wait_time=time_turn_on_s-time_now_s
+                wait_time=(time_turn_on_s-time_now_s)%86400 #86400=seconds in day, tomorrow if it has already gone today
                 Master.timer = False
-                QtCore.QTimer.singleShot((wait_time*1e3), self.begin_cooldown)        
+                QtCore.QTimer.singleShot(int(clock.real_seconds(wait_time)*1e3), self.begin_cooldown)
         else:
-            self.timer = QtCore.QTime()
-            self.timer.start()
-            if Master.logging == True:
-                with open(self.log_file, 'a') as logging_file:
-                    writer_log = csv.writer(logging_file)
-                    writer_log.writerow(['timestamp(s)', 'c_head_temp(K)', 'film_burner_temp(K)', 'mainplate_temp(K)', 'he_pump_temp(K)', 'heat_sw_temp(K)'])
-            #ensure VSources off
-            Master.Keithley.write("INST:NSEL 1")
-            Master.Keithley.write('CHAN:OUTP OFF')
-            Master.Keithley.write("INST:NSEL 2")
-            Master.Keithley.write('CHAN:OUTP OFF')
-            #start temp monitors
-            self.Temp_thread = TempThread()
-            self.Temp_thread.update_GUI_sig.connect(self.update_GUI)
-            self.Temp_thread.finished.connect(self.done)
-            self.Temp_thread.start()
+            Master.engine.start()
+            for role, readout in self.readouts().items():
+                if role not in Master.engine.plan.roles:
+                    readout.setText('-') #not in the sensor map
+            self.history = DecimatedHistory(Master.engine.plan.roles, Master.settings.plot_history)
+            self.plot.set_history(self.history, Master.engine.plan.roles)
             self.stop_butt.setEnabled(True)
             self.start_butt.setEnabled(False)
 
     def stop_cooldown(self): #Stops the cooldown - disables all VSources and resets GUI
         prompt=QtWidgets.QMessageBox.question(self, 'Stop!', 'Are you sure you want to stop?', QtWidgets.QMessageBox.Yes, QtWidgets.QMessageBox.No)
         if prompt == QtWidgets.QMessageBox.Yes:
-            self.Temp_thread.terminate() #kill the threads
-            try:
-                self.CooldownThreadStage1.terminate()
-            except AttributeError:
-                pass
-            try:
-                self.CooldownThreadStage2.terminate()
-            except AttributeError:
-                pass    
-            #Turn all voltage sources off
-            Master.Keithley.write("INST:NSEL 1")
-            Master.Keithley.write("VOLT 0")
-            Master.Keithley.write('CHAN:OUTP OFF')
-            Master.Keithley.write("INST:NSEL 2")
-            Master.Keithley.write("VOLT 0")
-            Master.Keithley.write('CHAN:OUTP OFF')
-            self.Stage1 = False
-            self.Stage2 = False
+            #stops sampling and the stages, closes the log and turns all voltage sources off, reading them back to check
+            report = Master.engine.stop()
+            self.heater_val.setText(str(report))
+            if not report.verified():
+                self.msg = QtWidgets.QMessageBox()
+                self.msg.setIcon(QtWidgets.QMessageBox.Warning)
+                self.msg.setText("Heaters not confirmed off - {}!".format(report))
+                self.msg.setWindowTitle("Error")
+                self.msg.setStandardButtons(QtWidgets.QMessageBox.Ok)
+                self.msg.show()
             self.stage_val.setText('0')
             self.stop_butt.setEnabled(False)
+            self.start_stage2_butt.setEnabled(False)
             self.start_butt.setEnabled(True)
         else:
             pass
 
-    def update_GUI(self, temp_list): #Updates the GUI with temperatures and will initiate the stages as they are needed
-        timestamp=self.timer.elapsed()
-        self.el_time.setText(str(round(timestamp/3600000,3)))
-        if Master.logging == True:
-            with open(Master.log_file, 'a') as logging_file:
-                writer_log = csv.writer(logging_file)
-                log_entry=[str(timestamp)]+temp_list
-                writer_log.writerow(log_entry)
-        #This section recalibrates the SIM921 gain settings if the amp gets overloaded.
-        if temp_list[0] == Master.current_head_temp:
-            Master.head_repeat_temps += 1
-        else:
-            Master.current_head_temp = temp_list[0]
-            Master.head_repeat_temps=0
-        if Master.head_repeat_temps > 5:
-            Master.SIM900.write(Master.ACBridgeSlot, 'AGAI ON')
-            Master.head_repeat_temps = 0
+    def engine_failed(self, error, report): #The sampler or recipe hit an error and stopped the cooldown - resets the GUI as a stop does
+        self.heater_val.setText(str(report))
+        self.msg = QtWidgets.QMessageBox()
+        self.msg.setIcon(QtWidgets.QMessageBox.Warning)
+        self.msg.setText("Cooldown stopped by an error: {}\nHeaters: {}".format(error, report))
+        self.msg.setWindowTitle("Error")
+        self.msg.setStandardButtons(QtWidgets.QMessageBox.Ok)
+        self.msg.show()
+        self.stage_val.setText('0')
+        self.stop_butt.setEnabled(False)
+        self.start_stage2_butt.setEnabled(False)
+        self.start_butt.setEnabled(True)
+
+    def readouts(self): #Role -> the label showing its temperature
+        return {'head': self.cold_head_temp, 'film_burner': self.FB_temp, 'mainplate': self.MP_temp,
+                'pump': self.He_pump_temp, 'heat_switch': self.Heat_sw_temp}
+
+    def update_GUI(self, sample): #Updates the GUI with the temperatures, the engine has already logged the sample and acted on it
+        engine = Master.engine
+        timestamp = sample.t
+        self.el_time.setText(str(round(timestamp/3600,3)))
+        self.stage_val.setText(str(engine.stage))
+        self.start_stage2_butt.setEnabled(engine.can_jump())
+        stats = engine.scheduler.stats
+        self.timing_val.setText('{:.3f}s \u00b1{:.1f}ms, {} skipped'.format(stats.mean_period or stats.period, stats.jitter()*1e3, stats.skipped))
+        if engine.log_writer is not None:
+            if engine.log_writer.error is not None:
+                self.log_val.setText('Error: {}'.format(engine.log_writer.error))
+            else:
+                self.log_val.setText('{} rows, {} dropped'.format(engine.log_writer.written, engine.log_writer.dropped))
         #Updates the GUI with the temperatures
-        self.cold_head_temp.setText(temp_list[0])
-        self.FB_temp.setText(temp_list[1])
-        self.MP_temp.setText(temp_list[2])
-        self.He_pump_temp.setText(temp_list[3])
-        self.Heat_sw_temp.setText(temp_list[4])
-        #master pump temp for cooldown thread.
-        Master.current_pump_temp=temp_list[3]
-
-        if self.Stage1 == False and self.Stage2 == False:
-            #if float(self.He_pump_temp.text()) < 10.0:
-            self.CooldownThreadStage1 = CooldownThreadStage1()
-            self.CooldownThreadStage1.start()
-            self.Stage1 = True
-            self.stage_val.setText('1')
-
-        if self.Stage1 == True:
-            if float(self.He_pump_temp.text()) > Master.CDStage1_Pump_lower_temp and float(self.cold_head_temp.text()) < Master.CDStage1_ThHold:
-                self.CooldownThreadStage1.terminate()
-                Master.Keithley.write("INST:NSEL 1")
-                Master.Keithley.write("VOLT 0")
-                Master.Keithley.write('CHAN:OUTP OFF')
-                self.Stage1 = False
-                self.CooldownThreadStage2 = CooldownThreadStage2()
-                self.CooldownThreadStage2.start()
-                self.Stage2 = True
-                self.stage_val.setText('2')
+        for role, readout in self.readouts().items(): #a custom sensor map needn't have all of them
+            if role in sample:
+                readout.setText('{:.5g}'.format(sample[role]))
+        self.switches_val.setText(str(engine.plan.last_switches))
+        self.io_val.setText(engine.keithley_io.summary())
+        if sample.heater is not None:
+            #an output that is on with volts across it but no current means an open heater
+            open_channels = open_heaters(sample.heater, engine.Keithley.state)
+            self.heater_val.setText('  '.join('ch{} {:.3g}V {:.3g}mA{}'.format(channel, volts, amps*1e3, ' OPEN' if channel in open_channels else '')
+                                              for channel, (volts, amps) in enumerate(sample.heater, 1)))
+        if self.history is not None:
+            self.history.append(timestamp, sample.fresh_values())
     
-    def jump_to_stage_2(self): #For jumping to Stage2 before the head has cooled below the threshold
-        prompt=QtWidgets.QMessageBox.question(self, 'Stop!', 'Are you sure you want to jump to stage 2? Hold time will be increased if the head is allowed to cool properly.', QtWidgets.QMessageBox.Yes, QtWidgets.QMessageBox.No)
+    def jump_to_next_stage(self): #For jumping to the next stage early, eg Stage2 before the head has cooled below the threshold
+        prompt=QtWidgets.QMessageBox.question(self, 'Stop!', 'Are you sure you want to jump to the next stage? Hold time will be increased if the head is allowed to cool properly.', QtWidgets.QMessageBox.Yes, QtWidgets.QMessageBox.No)
         if prompt == QtWidgets.QMessageBox.Yes:
-            self.Stage1 = False
-            self.Stage2=True
-            self.CooldownThreadStage1.terminate()
-            Master.Keithley.write("INST:NSEL 1")
-            Master.Keithley.write("VOLT 0")
-            Master.Keithley.write('CHAN:OUTP OFF')
-            self.CooldownThreadStage2 = CooldownThreadStage2()
-            self.CooldownThreadStage2.start()
-            self.stage_val.setText('2')
+            Master.engine.next_stage()
+            self.stage_val.setText(str(Master.engine.stage))
+            self.start_stage2_butt.setEnabled(Master.engine.can_jump())
         else:
             pass
 
-    def done(self):
-        self.stop_butt.setEnabled(False)
-        self.start_butt.setEnabled(True)
-
 
-class TempThread(QtCore.QThread): #Read the thermometers and returns the data to the GUI
-    #signals
-    update_GUI_sig = QtCore.pyqtSignal(list) #self?
+class LivePlot(QtWidgets.QWidget): #Temperature history on a log scale, redrawn once a second if it has changed
+                                   #Draws the min/max envelope at about one bucket per pixel. Mouse wheel zooms the time axis, double click shows everything
+    colours = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f']
 
     def __init__(self, parent=None):
-        super(TempThread, self).__init__(parent)
-
-    def __del__(self):
-        self.wait()
-
-    def run(self):
-        while True:
-            #read thermometers
-            #punt data back to GUI
-            c_head_temp = Master.SIM900.ask(Master.ACBridgeSlot, 'TVAL?') #Cold Head temp
-            film_burner_temp = Master.SIM900.ask(Master.ThermSlot1, 'TVAL? 1') #f_burner
-            mainplate_temp = Master.SIM900.ask(Master.ThermSlot1,'TVAL? 2')
-            he_pump_temp = Master.SIM900.ask(Master.ThermSlot1, 'TVAL? 3')
-            heat_sw_temp = Master.SIM900.ask(Master.ThermSlot1, 'TVAL? 4')
-
-            temp_data_str = [c_head_temp, film_burner_temp, mainplate_temp, he_pump_temp, heat_sw_temp]
-            self.update_GUI_sig.emit(temp_data_str)
-            self.sleep(1) #alter to vary time temps update
-
-class CooldownThreadStage1(QtCore.QThread): #Stage 1 will apply 26V (63mA 1.57W) to pump heater to raise to 50k stable.
-                                            #Head should cool to ~4K
+        super(LivePlot, self).__init__(parent)
+        self.history = None
+        self.labels = []
+        self.drawn_version = -1
+        self.window = None #seconds shown, None for the whole history
+        self.decades = (-1, 3) #0.1K to 1000K
+        self.setMinimumSize(300, 150)
+        self.redraw_timer = QtCore.QTimer(self)
+        self.redraw_timer.timeout.connect(self.refresh)
+        self.redraw_timer.start(1000)
+
+    def set_history(self, history, labels):
+        self.history = history
+        self.labels = labels
+        self.drawn_version = -1
+
+    def wheelEvent(self, event):
+        latest = self.history.latest() if self.history is not None else None
+        if latest is None:
+            return
+        window = self.window if self.window is not None else max(latest[0], 1.0)
+        self.window = window/2 if event.angleDelta().y() > 0 else window*2
+        self.update()
+
+    def mouseDoubleClickEvent(self, event):
+        self.window = None
+        self.update()
+
+    def refresh(self):
+        if self.history is not None and self.history.version != self.drawn_version:
+            self.update()
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), QtCore.Qt.white)
+        area = QtCore.QRectF(45, 5, self.width() - 130, self.height() - 25)
+        low, high = self.decades
+        def y_of(value):
+            return area.bottom() - (math.log10(value) - low)/(high - low)*area.height()
+        painter.setPen(QtGui.QColor('#cccccc'))
+        for decade in range(low, high + 1):
+            y = y_of(10**decade)
+            painter.drawLine(QtCore.QPointF(area.left(), y), QtCore.QPointF(area.right(), y))
+            painter.drawText(QtCore.QPointF(2, y + 4), '{:g}K'.format(10**decade))
+        painter.drawRect(area)
+        if self.history is None or not len(self.history):
+            painter.end()
+            return
+        self.drawn_version = self.history.version
+        end = self.history.latest()[0]
+        start = end - self.window if self.window is not None else 0.0
+        times, mins, maxs = self.history.query(start, end, int(area.width()))
+        span = max(end - start, 1e-9)
+        painter.drawText(QtCore.QPointF(area.left(), area.bottom() + 15), '-{:.2f} h'.format(span/3600))
+        painter.drawText(QtCore.QPointF(area.right() - 25, area.bottom() + 15), 'now')
+        for i, label in enumerate(self.labels):
+            colour = QtGui.QColor(self.colours[i % len(self.colours)])
+            points = QtGui.QPolygonF()
+            for t, low_value, high_value in zip(times, mins[i], maxs[i]):
+                x = area.left() + (t - start)/span*area.width()
+                for value in (low_value, high_value) if low_value != high_value else (low_value,):
+                    if value > 0: #skips NaN (not read that sample) and nonsense readings the log axis can't show
+                        points.append(QtCore.QPointF(x, y_of(min(max(value, 10**low), 10**high))))
+            painter.setPen(QtGui.QPen(colour, 1.5))
+            painter.drawPolyline(points)
+            painter.drawText(QtCore.QPointF(area.right() + 8, area.top() + 15*(i + 1)), label)
+        painter.end()
+
+
+class SampleRelay(QtCore.QObject): #Carries samples and errors from the engine's threads to the GUI thread
     #signals
-    def __init__(self, parent=None):
-        super(CooldownThreadStage1, self).__init__(parent)
-
-    def __del__(self):
-        self.wait()
-
-    def run(self):
-        #Sets output channel 1 on PS
-        Master.Keithley.write("INST:NSEL 1")
-        #Master.Keithley.write("CURR 0.063")
-        Master.Keithley.write('CHAN:OUTP ON')
-        #Ramp the voltage to 26V slowly
-        time_to_ramp = 300 #seconds
-        volts_per_sec = 25/time_to_ramp
-        voltage=0
-        initial_ramp=True
-        while voltage < 25:
-            voltage += volts_per_sec
-            if voltage>25:
-                voltage=25
-            Master.Keithley.write("VOLT %f" % voltage)
-            self.sleep(1)
-        while True:
-            temp=float(Master.current_pump_temp)
-            if temp > 48.0:
-                Master.Keithley.write('CHAN:OUTP OFF')
-                initial_ramp=False
-            elif temp < 47.0:
-                if initial_ramp==True:
-                    pass
-                else:
-                   Master.Keithley.write("VOLT 2.5")
-                   Master.Keithley.write('CHAN:OUTP ON')
-            self.sleep(1)
-
-        
+    sample_sig = QtCore.pyqtSignal(object) #fridge.samples.Sample
+    error_sig = QtCore.pyqtSignal(object, object) #the exception, the engine's StopReport
 
-class CooldownThreadStage2(QtCore.QThread): #Stage 2 after stage one killed (heater OFF). Heat switch will be slowly ramped to 6V and cooling will begin. 
-    #signals
-    def __init__(self, parent=None):
-        super(CooldownThreadStage2, self).__init__(parent)
-
-    def __del__(self):
-        self.wait()
-
-    def run(self):
-        #Waits 5 mins after heater set to OFF
-        self.sleep(300)
-        #Sets output channel 2 on PS
-        Master.Keithley.write("INST:NSEL 2")
-        Master.Keithley.write('CHAN:OUTP ON')
-        #Ramp the voltage to 6V slowly
-        time_to_ramp = 300 #seconds
-        volts_per_sec = 6/time_to_ramp
-        voltage=0
-        while voltage < 6:
-            voltage += volts_per_sec
-            if voltage>6:
-                voltage=6
-            Master.Keithley.write("VOLT %f" % voltage)
-            self.sleep(1)
-        
 ####################
 
 ####################
@@ -0,0 +1,5 @@
+from .sensors import Sensor, AcquisitionPlan, default_sensor_map, load_sensor_map
+from .samples import Sample
+from .stream import SampleStream, StreamClosed
+from .settings import Settings
+from .engine import CooldownEngine
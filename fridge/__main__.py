@@ -0,0 +1,89 @@
+#Headless cooldown, for running from a shell, cron or systemd without a display:
+#    python -m fridge --keithley <address> --sim900 <address> [--settings profile.json] [--log temp_log.txt]
+#Runs until Ctrl-C or SIGTERM, then stops the stages and turns the heaters off. --simulate runs it against the simulated
+#fridge in simulator/ instead, no instruments (or PyVisa) needed, --speed 100 a hundred times faster than real time and
+#--virtual 24 through 24 simulated hours on a virtual clock as fast as it can go.
+
+import argparse
+import signal
+import sys
+import threading
+from .engine import CooldownEngine
+from .settings import Settings
+from .clock import MonotonicClock, ScaledClock, VirtualClock
+
+def status_line(engine, sample):
+    return '{:.3f}h stage {} '.format(sample.t/3600, engine.stage) + ' '.join(
+        '{}={:.5g}'.format(role, sample[role]) for role in engine.plan.roles)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m fridge', description='Run a cooldown without the GUI')
+    parser.add_argument('--keithley', help='VISA address of the Keithley 2230G')
+    parser.add_argument('--sim900', help='VISA address of the SIM900')
+    parser.add_argument('--settings', help='JSON settings profile, anything missing keeps its default')
+    parser.add_argument('--recipe', help='JSON cooldown recipe, the standard GL4 one if not given')
+    parser.add_argument('--log', help='log file, turns logging on')
+    parser.add_argument('--status-interval', type=float, default=60.0, help='seconds between status lines, 0 for none')
+    parser.add_argument('--list', action='store_true', help='list the VISA resources and exit')
+    parser.add_argument('--simulate', action='store_true', help='run against the simulated GL4 (simulator/) instead of real instruments')
+    parser.add_argument('--speed', type=float, default=1.0, help='with --simulate, times faster than real time to run')
+    parser.add_argument('--virtual', type=float, metavar='HOURS', help='with --simulate, run this many simulated hours on a virtual clock and stop')
+    args = parser.parse_args(argv)
+    if (args.speed != 1.0 or args.virtual) and not args.simulate:
+        parser.error('--speed and --virtual need --simulate')
+    clock = VirtualClock() if args.virtual else ScaledClock(args.speed) if args.speed != 1.0 else MonotonicClock()
+    rm = None
+    if args.simulate:
+        from simulator import SimulatedResourceManager, SIM900_ADDRESS, KEITHLEY_ADDRESS, modules_for
+        rm = SimulatedResourceManager(clock=clock)
+        args.keithley = args.keithley or KEITHLEY_ADDRESS
+        args.sim900 = args.sim900 or SIM900_ADDRESS
+    if args.list:
+        if rm is None:
+            from visa import ResourceManager
+            rm = ResourceManager()
+        for resource in rm.list_resources():
+            print(resource)
+        return
+    if not args.keithley or not args.sim900:
+        parser.error('--keithley and --sim900 are needed')
+    settings = Settings.load(args.settings) if args.settings else Settings()
+    if args.recipe:
+        settings.recipe_file = args.recipe
+    if args.log:
+        settings.logging = True
+        settings.log_file = args.log
+
+    engine = CooldownEngine(settings, clock)
+    if args.simulate: #the simulated SIM900 is wired up to match the sensor map
+        rm.modules = modules_for(engine.sensor_map())
+    engine.open_devices(args.keithley, args.sim900, rm)
+    last_status = [None]
+    def status(sample):
+        if args.status_interval > 0 and (last_status[0] is None or sample.t - last_status[0] >= args.status_interval):
+            last_status[0] = sample.t
+            print(status_line(engine, sample))
+            sys.stdout.flush()
+    engine.listeners.append(status)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set()) #systemd stops services with SIGTERM
+    engine.start()
+    try:
+        if clock.virtual:
+            engine.run_until(lambda engine: stop.is_set(), args.virtual*3600)
+        else:
+            while engine.running() and not stop.wait(1.0):
+                pass
+    except KeyboardInterrupt:
+        pass
+    report = engine.stop() #the stop report of the run stopping itself if it hit an error
+    if engine.error is not None:
+        print('stopped on an error: {!r}'.format(engine.error))
+    print(report)
+    print(engine.savings_summary())
+    print(engine.scheduler.stats.summary())
+
+if __name__ == '__main__':
+    main()
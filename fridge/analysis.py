@@ -0,0 +1,259 @@
+#Offline cooldown analysis. Streams CSV or binary logs in chunks into NumPy arrays and works out per-run figures of merit:
+#
+#  python -m fridge.analysis [--jobs N] [--csv] log1.txt log2.gl4 ...
+#
+#A new run starts wherever the timestamp goes backwards (each cooldown appended to a log starts again from zero).
+#Base temperature and the hold are judged on the head unless --base-role names another sensor. Binary logs say which
+#column is which sensor; a CSV log written with a custom sensor map needs --head-column/--pump-column/--mainplate-column.
+#Old logs with millisecond timestamps need --time-scale 0.001.
+#Needs NumPy, except for the table printing (simulator.optimise uses that too).
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+try:
+    import numpy as np
+except ImportError: #only format_cell and print_table work without it
+    np = None
+
+from .binlog import BinaryLog, MAGIC
+from .sensors import default_sensor_map
+
+ROLE_COLUMNS = dict((s.name, s.role) for s in default_sensor_map('', '')) #column name -> role, for CSV logs
+
+def ffill(values, carry):
+    #Forward fills NaNs (sensors not read that sample) from the previous value, carry is the last value of the chunk before
+    mask = ~np.isnan(values)
+    index = np.where(mask, np.arange(len(values)), 0)
+    np.maximum.accumulate(index, out=index)
+    filled = values[index]
+    if not mask[0]:
+        filled[:np.argmax(mask) if mask.any() else len(values)] = carry
+    return filled
+
+
+def csv_chunks(path, chunk_rows):
+    #Yields (columns, 2D array) blocks. Repeated header rows are dropped, blank cells become NaN
+    with open(path) as log_file:
+        columns = log_file.readline().strip().split(',')
+        while True:
+            lines = list(islice(log_file, chunk_rows))
+            if not lines:
+                return
+            lines = [line for line in lines if line.strip() and not line[0].isalpha()]
+            if not lines:
+                continue
+            text = ''.join(lines)
+            text = text.replace(',,', ',nan,').replace(',,', ',nan,').replace(',\n', ',nan\n')
+            values = np.fromstring(text.replace('\n', ','), sep=',')
+            if values.size != len(lines)*len(columns):
+                values = np.array([[float(x) if x.strip() else np.nan for x in line.split(',')] for line in lines])
+            yield columns, values.reshape(-1, len(columns))
+
+
+def binary_chunks(path):
+    with BinaryLog(path) as log:
+        for chunk in log.iter_chunks():
+            yield log.columns, np.column_stack([np.frombuffer(c, dtype=np.float64) for c in chunk])
+
+
+def is_binary(path):
+    with open(path, 'rb') as log_file:
+        return log_file.read(len(MAGIC)) == MAGIC
+
+
+def log_chunks(path, chunk_rows):
+    return binary_chunks(path) if is_binary(path) else csv_chunks(path, chunk_rows)
+
+
+def log_roles(path):
+    #Column name -> role. A binary log carries the sensor map it was written with (unless it was converted from CSV), a CSV
+    #log is taken to have the default one
+    if is_binary(path):
+        with BinaryLog(path) as log:
+            sensors = log.meta.get('sensors')
+        if sensors:
+            return dict((s['name'], s['role']) for s in sensors)
+    return dict(ROLE_COLUMNS)
+
+
+def role_indexes(path, columns, roles, overrides):
+    #Index of the column holding each role. overrides (role -> column name) beat what the log says
+    indexes = {}
+    names = dict((role, name) for name, role in log_roles(path).items())
+    names.update(overrides or {})
+    for role in roles:
+        name = names.get(role, role)
+        if name not in columns:
+            raise ValueError('{}: no column for the {} (looked for {!r}, the log has {}), give it with --{}-column'.format(
+                path, role, name, ', '.join(columns[1:]), role.replace('_', '-')))
+        indexes[role] = columns.index(name)
+    return indexes
+
+
+class RunMetrics(object):
+    #Accumulates one run's figures chunk by chunk so memory use doesn't depend on the log length.
+    #Stage 1 ends the way the GUI ends it - the first sample with the pump above the lower pump temperature and the head
+    #below the head threshold. Base temperature is the base stage (the head, on the SIM921 bridge, unless told otherwise)
+    #below base_temp, the hold lasts until it climbs back above base_temp + hold_margin.
+    def __init__(self, name, th_hold, pump_lower, overshoot_ref, base_temp, hold_margin):
+        self.name = name
+        self.th_hold = th_hold
+        self.pump_lower = pump_lower
+        self.overshoot_ref = overshoot_ref
+        self.base_temp = base_temp
+        self.hold_margin = hold_margin
+        self.t0 = None
+        self.t_end = None
+        self.samples = 0
+        self.head_cross = None
+        self.transition = None
+        self.pump_max = -np.inf
+        self.time_over = 0.0
+        self.base_reached = None
+        self.hold_end = None
+        self.base_min = np.inf
+        self.last_t = None
+
+    def update(self, t, head, pump, base):
+        if self.t0 is None:
+            self.t0 = t[0]
+        self.samples += len(t)
+        dt = np.diff(t, prepend=t[0] if self.last_t is None else self.last_t)
+        if self.head_cross is None:
+            hits = np.flatnonzero(head < self.th_hold)
+            if hits.size:
+                self.head_cross = t[hits[0]] - self.t0
+        stage1 = len(t)
+        if self.transition is None:
+            hits = np.flatnonzero((pump > self.pump_lower) & (head < self.th_hold))
+            if hits.size:
+                stage1 = hits[0]
+                self.transition = t[stage1]
+        else:
+            stage1 = 0
+        if stage1 and np.isfinite(pump[:stage1]).any():
+            self.pump_max = max(self.pump_max, np.nanmax(pump[:stage1]))
+            self.time_over += dt[:stage1][pump[:stage1] > self.overshoot_ref].sum()
+        if self.transition is not None and self.hold_end is None:
+            after = t >= self.transition
+            if np.isfinite(base[after]).any():
+                self.base_min = min(self.base_min, np.nanmin(base[after]))
+            if self.base_reached is None:
+                hits = np.flatnonzero(after & (base < self.base_temp))
+                if hits.size:
+                    self.base_reached = t[hits[0]]
+            if self.base_reached is not None:
+                hits = np.flatnonzero((t > self.base_reached) & (base > self.base_temp + self.hold_margin))
+                if hits.size:
+                    self.hold_end = t[hits[0]]
+        self.last_t = t[-1]
+        self.t_end = t[-1]
+
+    def summary(self):
+        def since(t, start):
+            return None if t is None or start is None else t - start
+        return {'run': self.name,
+                'samples': self.samples,
+                'duration_h': since(self.t_end, self.t0)/3600,
+                'stage1_h': since(self.transition, self.t0)/3600 if self.transition is not None else None,
+                'head_cross_h': self.head_cross/3600 if self.head_cross is not None else None,
+                'pump_overshoot_K': max(0.0, self.pump_max - self.overshoot_ref) if np.isfinite(self.pump_max) else None,
+                'pump_over_min': self.time_over/60,
+                'stage2_to_base_h': since(self.base_reached, self.transition)/3600 if self.base_reached is not None else None,
+                'hold_h': since(self.hold_end if self.hold_end is not None else self.t_end, self.base_reached)/3600 if self.base_reached is not None else None,
+                'hold_ended': self.hold_end is not None,
+                'base_min_K': self.base_min if np.isfinite(self.base_min) else None}
+
+
+def analyse(path, th_hold=4.2, pump_lower=45.0, overshoot_ref=48.0, base_temp=1.0, hold_margin=0.1, time_scale=1.0, chunk_rows=200000,
+            columns=None, base_role='head'):
+    #Returns a summary per run in the log. columns maps roles to column names where the log's own sensor map doesn't,
+    #base_role is the sensor base temperature and the hold are judged on
+    if np is None:
+        raise ImportError('the log analysis needs NumPy')
+    runs = []
+    current = None
+    carry = {}
+    roles = None
+    for names, block in log_chunks(path, chunk_rows):
+        if roles is None:
+            roles = role_indexes(path, names, sorted(set(('head', 'pump', base_role))), columns)
+        t = block[:, 0]*time_scale
+        starts = [0] + list(np.flatnonzero(np.diff(t) < 0) + 1) + [len(t)]
+        if current is not None and current.last_t is not None and t[0] < current.last_t:
+            current = None
+        for start, end in zip(starts[:-1], starts[1:]):
+            if start != 0 or current is None:
+                current = RunMetrics('{}:{}'.format(os.path.basename(path), len(runs) + 1), th_hold, pump_lower, overshoot_ref, base_temp, hold_margin)
+                runs.append(current)
+                carry = {}
+            series = {}
+            for role in roles:
+                values = block[start:end, roles[role]]
+                series[role] = ffill(values, carry.get(role, np.nan))
+                carry[role] = series[role][-1]
+            current.update(t[start:end], series['head'], series['pump'], series[base_role])
+    return [run.summary() for run in runs]
+
+
+COLUMNS = ['run', 'samples', 'duration_h', 'stage1_h', 'head_cross_h', 'pump_overshoot_K', 'pump_over_min', 'stage2_to_base_h', 'hold_h', 'hold_ended', 'base_min_K']
+
+def format_cell(value):
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return '{:.3f}'.format(value)
+    return str(value)
+
+
+def print_table(summaries, out=sys.stdout, as_csv=False, columns=COLUMNS): #summaries are dicts, columns the keys printed
+    rows = [[format_cell(s[c]) for c in columns] for s in summaries]
+    if as_csv:
+        out.write(','.join(columns) + '\n')
+        for row in rows:
+            out.write(','.join(row) + '\n')
+        return
+    widths = [max([len(c)] + [len(row[i]) for row in rows]) for i, c in enumerate(columns)]
+    out.write('  '.join(c.rjust(w) for c, w in zip(columns, widths)) + '\n')
+    for row in rows:
+        out.write('  '.join(cell.rjust(w) for cell, w in zip(row, widths)) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Summarise cooldown logs')
+    parser.add_argument('logs', nargs='+')
+    parser.add_argument('--th-hold', type=float, default=4.2, help='cold head threshold for stage 2 (K)')
+    parser.add_argument('--pump-lower', type=float, default=45.0, help='lower pump temperature for stage 2 (K)')
+    parser.add_argument('--overshoot-ref', type=float, default=48.0, help='pump temperature overshoot is measured from (K)')
+    parser.add_argument('--base-role', default='head', help='sensor base temperature and the hold are judged on, eg mainplate')
+    parser.add_argument('--base-temp', type=float, default=1.0, help='base stage temperature counted as base (K)')
+    parser.add_argument('--hold-margin', type=float, default=0.1, help='rise above base that ends the hold (K)')
+    parser.add_argument('--time-scale', type=float, default=1.0, help='seconds per timestamp unit, 0.001 for old millisecond logs')
+    for role in ('head', 'pump', 'mainplate'):
+        parser.add_argument('--{}-column'.format(role), help='log column holding the {} temperature, if not the sensor map\'s'.format(role))
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='logs analysed in parallel')
+    parser.add_argument('--csv', action='store_true', help='print CSV instead of a table')
+    args = parser.parse_args(argv)
+    options = dict(th_hold=args.th_hold, pump_lower=args.pump_lower, overshoot_ref=args.overshoot_ref,
+                   base_temp=args.base_temp, hold_margin=args.hold_margin, time_scale=args.time_scale, base_role=args.base_role,
+                   columns=dict((role, getattr(args, role + '_column')) for role in ('head', 'pump', 'mainplate') if getattr(args, role + '_column')))
+    summaries = []
+    try:
+        if args.jobs > 1 and len(args.logs) > 1:
+            with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+                futures = [pool.submit(analyse, path, **options) for path in args.logs]
+                for future in futures:
+                    summaries += future.result()
+        else:
+            for path in args.logs:
+                summaries += analyse(path, **options)
+    except ValueError as e:
+        sys.exit(str(e))
+    print_table(summaries, as_csv=args.csv)
+
+if __name__ == '__main__':
+    main()
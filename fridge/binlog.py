@@ -0,0 +1,211 @@
+#Binary columnar log format. After a JSON header describing the columns and the sensor map the file is a run of
+#append-only chunks, each a block of float64 columns, so a whole run can be pulled out of a memory map with a few copies.
+#
+#  header: b'GL4BLOG1', uint32 json length, uint32 0, json padded to 8 bytes
+#  chunk:  b'CHNK', uint32 rows, uint32 columns, uint32 0, then columns*rows little-endian float64, column after column
+#
+#Run as a script to convert between this and the CSV log: python -m fridge.binlog [--force] tobin|tocsv <in> <out>
+#The converter writes a new file and won't replace one that is already there without --force.
+
+import argparse
+import csv
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_right
+
+MAGIC = b'GL4BLOG1'
+CHUNK = b'CHNK'
+FILE_HEADER = struct.Struct('<8sII')
+CHUNK_HEADER = struct.Struct('<4sIII')
+
+def to_float(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+class BinarySink(object): #LogWriter sink writing the binary format, each batch of rows becomes one chunk
+    def __init__(self, path, header, sensors=None):
+        self.path = path
+        self.columns = list(header)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with BinaryLog(path) as existing:
+                if existing.columns != self.columns:
+                    raise ValueError('{} already holds a log with different columns'.format(path))
+                end = existing.end
+            #Anything past the last whole chunk is a chunk cut short by a crash, which would hide every chunk after it
+            self.file = open(path, 'r+b')
+            self.file.truncate(end)
+            self.file.seek(end)
+        else:
+            self.file = open(path, 'wb')
+            meta = {'columns': self.columns, 'created': time.ctime(),
+                    'sensors': [dict(slot=s.slot, channel=s.channel, name=s.name, role=s.role) for s in (sensors or [])]}
+            text = json.dumps(meta).encode()
+            text += b' '*(-len(text) % 8)
+            self.file.write(FILE_HEADER.pack(MAGIC, len(text), 0))
+            self.file.write(text)
+
+    def write_rows(self, rows):
+        if not rows:
+            return
+        data = array('d')
+        for i in range(len(self.columns)):
+            data.extend(to_float(row[i]) if i < len(row) else float('nan') for row in rows)
+        if sys.byteorder != 'little':
+            data.byteswap()
+        self.file.write(CHUNK_HEADER.pack(CHUNK, len(rows), len(self.columns), 0))
+        data.tofile(self.file)
+
+    def flush(self, sync):
+        self.file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
+
+    def size(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class BinaryLog(object): #Memory mapped reader. A chunk cut short by a crash mid-write is ignored
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, length, _ = FILE_HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError('{} is not a binary cooldown log'.format(path))
+        self.meta = json.loads(self.map[FILE_HEADER.size:FILE_HEADER.size + length].decode())
+        self.columns = self.meta['columns']
+        self.chunk_offsets = [] #byte offset of each chunk's data
+        self.chunk_rows = []
+        self.row_starts = [] #index of each chunk's first row
+        offset = FILE_HEADER.size + length
+        total = 0
+        while offset + CHUNK_HEADER.size <= len(self.map):
+            tag, rows, columns, _ = CHUNK_HEADER.unpack_from(self.map, offset)
+            end = offset + CHUNK_HEADER.size + rows*columns*8
+            if tag != CHUNK or columns != len(self.columns) or end > len(self.map):
+                break
+            self.chunk_offsets.append(offset + CHUNK_HEADER.size)
+            self.chunk_rows.append(rows)
+            self.row_starts.append(total)
+            total += rows
+            offset = end
+        self.rows = total
+        self.end = offset #byte offset just past the last whole chunk
+
+    def __len__(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def chunk_column(self, chunk, index): #float64 values of one column in one chunk, copied out of the map
+        rows = self.chunk_rows[chunk]
+        start = self.chunk_offsets[chunk] + index*rows*8
+        values = array('d', self.map[start:start + rows*8])
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return values
+
+    def column(self, name): #Whole column as an array('d')
+        index = self.columns.index(name)
+        values = array('d')
+        for chunk in range(len(self.chunk_rows)):
+            values.extend(self.chunk_column(chunk, index))
+        return values
+
+    def row(self, i): #Random access to one row
+        if i < 0:
+            i += self.rows
+        if not 0 <= i < self.rows:
+            raise IndexError(i)
+        chunk = bisect_right(self.row_starts, i) - 1
+        rows = self.chunk_rows[chunk]
+        within = i - self.row_starts[chunk]
+        base = self.chunk_offsets[chunk]
+        return [struct.unpack_from('<d', self.map, base + (index*rows + within)*8)[0] for index in range(len(self.columns))]
+
+    def iter_chunks(self): #Yields a list of column arrays per chunk, for streaming through a long run
+        for chunk in range(len(self.chunk_rows)):
+            yield [self.chunk_column(chunk, index) for index in range(len(self.columns))]
+
+
+def format_value(value):
+    return '' if value != value else repr(value)
+
+
+def make_room(path, overwrite): #The converters write a new file - BinarySink on its own would add to an existing one
+    if os.path.exists(path):
+        if not overwrite:
+            raise IOError('{} already exists, pass --force to overwrite it'.format(path))
+        os.remove(path)
+
+
+def csv_to_binary(csv_path, bin_path, chunk_rows=10000, sensors=None, overwrite=False):
+    #Repeated header rows (one per cooldown appended to the same file) are skipped, a different header is an error
+    make_room(bin_path, overwrite)
+    with open(csv_path, newline='') as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader)
+        sink = BinarySink(bin_path, header, sensors)
+        try:
+            rows = []
+            for row in reader:
+                if not row:
+                    continue
+                if row[0] == header[0]:
+                    if row != header:
+                        raise ValueError('{} changes columns part way through'.format(csv_path))
+                    continue
+                rows.append(row)
+                if len(rows) >= chunk_rows:
+                    sink.write_rows(rows)
+                    rows = []
+            sink.write_rows(rows)
+        finally:
+            sink.close()
+
+
+def binary_to_csv(bin_path, csv_path, overwrite=False):
+    make_room(csv_path, overwrite)
+    with BinaryLog(bin_path) as log, open(csv_path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(log.columns)
+        for columns in log.iter_chunks():
+            writer.writerows([format_value(v) for v in row] for row in zip(*columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert cooldown logs between CSV and the binary format')
+    parser.add_argument('direction', choices=['tobin', 'tocsv'])
+    parser.add_argument('source')
+    parser.add_argument('dest')
+    parser.add_argument('--force', action='store_true', help='overwrite dest if it exists')
+    args = parser.parse_args(argv)
+    try:
+        if args.direction == 'tobin':
+            csv_to_binary(args.source, args.dest, overwrite=args.force)
+        else:
+            binary_to_csv(args.source, args.dest, overwrite=args.force)
+    except (IOError, ValueError) as e:
+        sys.exit(str(e))
+
+if __name__ == '__main__':
+    main()
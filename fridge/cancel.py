@@ -0,0 +1,34 @@
+#Cooperative cancellation - long running work sleeps on a CancelToken and checks it between instrument operations, so a
+#stop takes effect at the next check (milliseconds) instead of killing a thread in the middle of a VISA write
+
+import threading
+from .clock import MonotonicClock
+
+class Cancelled(Exception):
+    pass
+
+
+class CancelToken(object):
+    def __init__(self, clock=None):
+        self.clock = clock if clock is not None else MonotonicClock() #the waits and sleeps are in its seconds
+        self.event = threading.Event()
+        self.cancelled_at = None #clock time of the cancel
+
+    def cancel(self):
+        if not self.event.is_set():
+            self.cancelled_at = self.clock.now()
+            self.event.set()
+
+    def cancelled(self):
+        return self.event.is_set()
+
+    def check(self): #Raises Cancelled once cancelled
+        if self.event.is_set():
+            raise Cancelled()
+
+    def wait(self, seconds): #Sleeps for up to seconds, returns True as soon as it is cancelled
+        return self.clock.wait(self.event, seconds)
+
+    def sleep(self, seconds): #clock.sleep that raises Cancelled as soon as it is cancelled
+        if self.wait(seconds):
+            raise Cancelled()
@@ -0,0 +1,74 @@
+#Clocks - everything that times a cooldown (sample deadlines, recipe waits and ramps, stop latency, the instruments' retry
+#sleeps, the simulator) asks the engine's clock instead of the time module, so the same run can go at real time, faster
+#than real time against the simulator, or on a virtual clock that jumps straight to the next deadline.
+#
+#A clock has now() (monotonic seconds), sleep(seconds), wait(event, seconds) (a threading.Event wait that gives up after
+#that long on this clock), real_seconds(seconds) (how long that really is, for Qt timers and condition waits) and wall()
+#(the epoch time on this clock, for time stamps). virtual is True for a clock that only moves when it is slept on - the
+#engine then has to be driven by run_until() on one thread rather than by its own threads.
+
+import time
+from hardware import SystemClock
+
+class MonotonicClock(SystemClock): #Real time
+    virtual = False
+
+    def wait(self, event, seconds):
+        return event.wait(seconds)
+
+    def real_seconds(self, seconds):
+        return seconds
+
+    def wall(self):
+        return time.time()
+
+
+class ScaledClock(MonotonicClock): #Runs speed times faster than real time, for watching the simulator get through a cooldown
+    def __init__(self, speed):
+        self.speed = float(speed)
+        self.origin = time.monotonic()
+        self.wall_origin = time.time()
+
+    def now(self):
+        return (time.monotonic() - self.origin)*self.speed
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds/self.speed)
+
+    def wait(self, event, seconds):
+        return event.wait(self.real_seconds(seconds))
+
+    def real_seconds(self, seconds):
+        return None if seconds is None else seconds/self.speed
+
+    def wall(self):
+        return self.wall_origin + self.now()
+
+
+class VirtualClock(object):
+    #Simulated time that only moves when slept on, so a wait of any length costs nothing. Only one thread may sleep on it -
+    #it is meant for CooldownEngine.run_until() with the simulator, where the instrument I/O takes no time at all.
+    virtual = True
+
+    def __init__(self, start=0.0, wall=None):
+        self.t = start
+        self.wall_origin = (time.time() if wall is None else wall) - start
+
+    def now(self):
+        return self.t
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.t += seconds
+
+    def wait(self, event, seconds):
+        if not event.is_set() and seconds is not None:
+            self.sleep(seconds)
+        return event.is_set()
+
+    def real_seconds(self, seconds):
+        return None if seconds is None else 0.0
+
+    def wall(self):
+        return self.wall_origin + self.t
@@ -0,0 +1,118 @@
+#Background log writer - rows are queued from whichever thread produces them and written out in batches by a worker thread,
+#so a slow SD card never holds up the GUI and the file isn't opened and closed for every sample
+
+import csv
+import os
+import queue
+import threading
+import time
+
+class CsvSink(object): #One open CSV log file
+    def __init__(self, path, header):
+        self.path = path
+        self.file = open(path, 'a', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(header)
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def flush(self, sync):
+        self.file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
+
+    def size(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class LogWriter(object):
+    #Rows go into a bounded queue and a worker thread writes them in batches of flush_rows or every flush_interval seconds,
+    #whichever comes first. If the queue is ever full new rows are dropped and counted rather than blocking the caller.
+    #fsync: 'never' leaves it to the OS, 'flush' syncs after every batch, 'close' only when the log is closed.
+    #rotate_bytes starts a new numbered file once the current one reaches that size, per_run gives every run its own file.
+    def __init__(self, path, header, max_queue=10000, flush_rows=100, flush_interval=5.0, fsync='never', rotate_bytes=0, per_run=False, sink=CsvSink):
+        self.header = list(header)
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.rotate_bytes = rotate_bytes
+        self.sink_type = sink
+        self.dropped = 0
+        self.written = 0
+        self.error = None
+        base, ext = os.path.splitext(path)
+        if per_run:
+            base = '{}_{}'.format(base, time.strftime('%Y%m%d-%H%M%S'))
+        self.base = base
+        self.ext = ext
+        self.part = 0
+        self.sink = self.sink_type(self.part_path(self.part), self.header)
+        self.queue = queue.Queue(max_queue)
+        self.thread = threading.Thread(target=self.run, name='LogWriter', daemon=True)
+        self.thread.start()
+
+    def part_path(self, part):
+        if part == 0:
+            return self.base + self.ext
+        return '{}.{}{}'.format(self.base, part, self.ext)
+
+    def log(self, row): #Never blocks
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=10.0): #Writes out everything still queued and closes the file, giving up after timeout seconds
+        #so a stuck disk (or a worker that has died with the queue full) can't hold up a heater shutdown
+        deadline = time.monotonic() + timeout
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            self.error = self.error or IOError('log writer stopped with {} rows still queued'.format(self.queue.qsize()))
+        self.thread.join(max(0.0, deadline - time.monotonic()))
+
+    def run(self):
+        batch = []
+        last_flush = time.monotonic()
+        running = True
+        while running:
+            try:
+                row = self.queue.get(timeout=max(0.0, last_flush + self.flush_interval - time.monotonic()))
+                if row is None:
+                    running = False
+                else:
+                    batch.append(row)
+            except queue.Empty:
+                pass
+            if batch and (not running or len(batch) >= self.flush_rows or time.monotonic() - last_flush >= self.flush_interval):
+                self.write(batch)
+                batch = []
+                last_flush = time.monotonic()
+            elif not batch:
+                last_flush = time.monotonic()
+        try:
+            self.sink.flush(self.fsync != 'never')
+            self.sink.close()
+        except Exception as e:
+            self.error = e
+
+    def write(self, batch):
+        try:
+            self.sink.write_rows(batch)
+            self.sink.flush(self.fsync == 'flush')
+            self.written += len(batch)
+            if self.rotate_bytes and self.sink.size() >= self.rotate_bytes:
+                #the next file is opened before this one is let go of, so if it can't be the log carries on in this one
+                sink = self.sink_type(self.part_path(self.part + 1), self.header)
+                old, self.sink = self.sink, sink
+                self.part += 1
+                try:
+                    old.flush(self.fsync != 'never')
+                finally:
+                    old.close()
+        except Exception as e: #keep the worker alive whatever the sink raises, the GUI shows the error
+            self.error = e
@@ -0,0 +1,107 @@
+#Min/max level-of-detail history for plotting long runs. Each level keeps the min and max of every sensor over buckets
+#factor times longer than the level below, updated as samples come in, so any zoom can be drawn with about one
+#bucket per pixel and a spike is never lost however far out it is drawn.
+
+from bisect import bisect_left, bisect_right
+from .ringbuffer import RingBuffer
+
+NAN = float('nan')
+
+def nan_min(a, b):
+    if a != a:
+        return b
+    if b != b:
+        return a
+    return min(a, b)
+
+def nan_max(a, b):
+    if a != a:
+        return b
+    if b != b:
+        return a
+    return max(a, b)
+
+
+class Bucket(object): #Partly filled bucket of one level
+    def __init__(self, width):
+        self.count = 0
+        self.start = None
+        self.mins = [NAN]*width
+        self.maxs = [NAN]*width
+
+    def add(self, t, mins, maxs):
+        if self.count == 0:
+            self.start = t
+            self.mins = list(mins)
+            self.maxs = list(maxs)
+        else:
+            self.mins = [nan_min(a, b) for a, b in zip(self.mins, mins)]
+            self.maxs = [nan_max(a, b) for a, b in zip(self.maxs, maxs)]
+        self.count += 1
+
+
+class DecimatedHistory(object):
+    #Raw samples plus `levels` min/max levels, each holding `capacity` buckets, so the coarsest level covers
+    #capacity*factor**levels samples. Has the same append/latest/version interface as RingBuffer.
+    def __init__(self, columns, capacity, factor=4, levels=6):
+        self.columns = list(columns)
+        self.factor = factor
+        self.raw = RingBuffer(self.columns, capacity)
+        self.levels = [RingBuffer([c + '_min' for c in self.columns] + [c + '_max' for c in self.columns], capacity) for i in range(levels)]
+        self.pending = [Bucket(len(self.columns)) for i in range(levels)]
+
+    def __len__(self):
+        return len(self.raw)
+
+    @property
+    def version(self):
+        return self.raw.version
+
+    def latest(self):
+        return self.raw.latest()
+
+    def append(self, t, values):
+        self.raw.append(t, values)
+        self.feed(0, t, values, values)
+
+    def feed(self, level, t, mins, maxs):
+        bucket = self.pending[level]
+        bucket.add(t, mins, maxs)
+        if bucket.count == self.factor:
+            self.levels[level].append(bucket.start, bucket.mins + bucket.maxs)
+            self.pending[level] = Bucket(len(self.columns))
+            if level + 1 < len(self.levels):
+                self.feed(level + 1, bucket.start, bucket.mins, bucket.maxs)
+
+    def query(self, start, end, points):
+        #Returns (times, mins, maxs) covering start..end with no more than about 2*points entries, mins/maxs are lists of
+        #per-sensor lists. Uses the finest level that both reaches back to start and is coarse enough.
+        n = len(self.columns)
+        chosen = None
+        for level in range(len(self.levels) + 1):
+            buffer = self.raw if level == 0 else self.levels[level - 1]
+            if not len(buffer):
+                break
+            times = buffer.ordered(buffer.times)
+            covers = len(buffer) < buffer.capacity or times[0] <= start
+            count = bisect_right(times, end) - bisect_left(times, start)
+            chosen = (level, buffer, times)
+            if covers and count <= 2*points:
+                break
+        if chosen is None:
+            return [], [[] for c in range(n)], [[] for c in range(n)]
+        level, buffer, times = chosen
+        first, last = bisect_left(times, start), bisect_right(times, end)
+        columns = [buffer.ordered(column)[first:last] for column in buffer.data]
+        times = list(times[first:last])
+        if level == 0:
+            return times, [list(c) for c in columns], [list(c) for c in columns]
+        mins = [list(c) for c in columns[:n]]
+        maxs = [list(c) for c in columns[n:]]
+        for bucket in reversed(self.pending[:level]): #the buckets still filling up carry the newest samples
+            if bucket.count and start <= bucket.start <= end:
+                times.append(bucket.start)
+                for i in range(n):
+                    mins[i].append(bucket.mins[i])
+                    maxs[i].append(bucket.maxs[i])
+        return times, mins, maxs
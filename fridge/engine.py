@@ -0,0 +1,315 @@
+#Headless cooldown engine - owns the instruments, the sampler, the recipe and the log. The Qt window and the command
+#line (python -m fridge) are both just clients: they start and stop it and look at the samples it hands to its listeners.
+#Two threads of its own do the work: the sampler, and the recipe thread which runs every stage of the cooldown recipe.
+#Both wait on the run's CancelToken, so stop() wakes them at once, and neither is ever killed in the middle of I/O.
+#All the timing goes by the engine's clock (fridge/clock.py). With a virtual clock there are no threads of its own: the
+#caller runs the cooldown on its own thread with run_until(), which jumps the clock straight to each deadline.
+#stop() limits the supply to safety commands, turns every output off and reads them back; the StopReport, the sampling
+#statistics and the time the recipe's conditions saved go in a .timing file next to the log.
+
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, TimeoutError as FutureTimeout
+from functools import partial
+from hardware import SIM900, Keithley2230G, VisaIOError
+from .sensors import AcquisitionPlan, default_sensor_map, load_sensor_map
+from .stream import SampleStream, StreamClosed
+from .scheduler import DeadlineScheduler, SamplingPolicy
+from .datalog import LogWriter, CsvSink
+from .samples import OVERLOAD, heater_columns
+from .executor import InstrumentExecutor, SAFETY, CONTROL, TELEMETRY
+from .recipe import Recipe, RecipeRun
+from .cancel import CancelToken, Cancelled
+from .clock import MonotonicClock
+
+#The standard GL4 cooldown, used when no recipe file is set
+DEFAULT_RECIPE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'recipes', 'gl4.json')
+
+class StopReport(object): #How long a stop took to get every output confirmed at 0V and off
+    def __init__(self, requested, confirmed, still_on):
+        self.latency = confirmed - requested #seconds from the stop request to the read back
+        self.still_on = still_on #channels that didn't read back as off, None if the supply didn't answer in time
+
+    def verified(self):
+        return self.still_on == []
+
+    def __str__(self):
+        if self.still_on is None:
+            return 'outputs NOT verified off, no read back after {:.0f}ms'.format(self.latency*1e3)
+        if self.still_on:
+            return 'outputs NOT verified off, channel {} still on after {:.0f}ms'.format(', '.join(str(c) for c in self.still_on), self.latency*1e3)
+        return 'outputs verified off in {:.0f}ms'.format(self.latency*1e3)
+
+
+class CooldownEngine(object):
+    def __init__(self, settings, clock=None):
+        self.settings = settings
+        self.clock = clock if clock is not None else MonotonicClock()
+        self.Keithley = None
+        self.SIM900 = None
+        self.keithley_io = None
+        self.sim900_io = None
+        #every new Sample is published here for the control loops
+        self.stream = SampleStream(self.clock)
+        self.listeners = [] #called with every Sample on the sampler thread after it has been logged, keep them quick
+        self.error_listeners = [] #called with the error and the StopReport when the sampler or recipe thread dies of an error
+        self.error = None #what stopped the last run early, None if nothing did
+        self.lock = threading.RLock() #guards the recipe, which is stepped by the recipe thread and jumped from outside
+        self.cancel = CancelToken(self.clock)
+        self.plan = None
+        self.policy = None
+        self.scheduler = None
+        self.sampler = None
+        self.log_writer = None
+        self.recipe = None
+        self.run = None
+        self.recipe_thread = None
+        self.subscription = None
+        self.last_stop = None
+
+    def open_devices(self, keithley_address, sim900_address, rm=None): #rm opens the addresses, PyVisa's ResourceManager if None
+        self.Keithley = Keithley2230G(keithley_address, rm=rm, clock=self.clock)
+        self.SIM900 = SIM900(sim900_address, mode=self.settings.SIM900_mode, rm=rm, clock=self.clock)
+        #from here on each instrument is only touched by its own I/O thread
+        self.keithley_io = InstrumentExecutor('Keithley I/O')
+        self.sim900_io = InstrumentExecutor('SIM900 I/O')
+
+    def sensor_map(self): #Sensors to read each cycle
+        if self.settings.sensor_map_file:
+            return load_sensor_map(self.settings.sensor_map_file)
+        return default_sensor_map(self.settings.ACBridgeSlot, self.settings.ThermSlot1)
+
+    def load_recipe(self):
+        return Recipe.load(self.settings.recipe_file or DEFAULT_RECIPE)
+
+    def policy_thresholds(self): #Temperatures where a sensor needs watching closely - the ones the recipe acts on
+        return self.recipe.thresholds(self.settings)
+
+    def keithley(self, channel, priority=CONTROL, **settings): #Sets a Keithley channel (volt=, curr=, output=) on its I/O thread, only sending what changes
+        return self.keithley_io.call(priority, self.Keithley.set, channel, **settings)
+
+    def heaters_off(self, requested=None): #Emergency/stop shutoff, confirmed by reading every output back. Returns a StopReport
+        #The supply's queue is cut down to safety jobs first, so nothing queued (or about to be) can land after the shutoff
+        requested = self.clock.now() if requested is None else requested
+        timeout = self.settings.stop_timeout
+        self.keithley_io.restrict(SAFETY)
+        try:
+            self.keithley_io.submit(SAFETY, self.Keithley.all_off).result(timeout)
+            still_on = self.keithley_io.submit(SAFETY, self.Keithley.still_on).result(timeout)
+        except (FutureTimeout, ValueError, VisaIOError):
+            still_on = None
+        return StopReport(requested, self.clock.now(), still_on)
+
+    def settings_changed(self): #Passes on the settings that can change in the middle of a run
+        if self.policy is not None and self.recipe is not None:
+            self.policy.thresholds = self.policy_thresholds()
+        if self.SIM900 is not None:
+            self.sim900_io.submit(CONTROL, setattr, self.SIM900, 'mode', self.settings.SIM900_mode)
+
+    def sample_age(self, sample): #Seconds since the reads for a sample started
+        return self.clock.now() - (self.scheduler.start_time + sample.t)
+
+    def running(self):
+        return self.sampler is not None and self.sampler.is_alive()
+
+    @property
+    def stage(self): #Name of the recipe stage running, '0' before the first one and 'done' after the last
+        if self.run is None or not self.run.history:
+            return '0'
+        if self.run.stage is None:
+            return 'done'
+        return self.run.stage
+
+    def start(self): #Starts sampling, the first stage of the recipe kicks off with the first sample
+        settings = self.settings
+        self.recipe = self.load_recipe()
+        self.plan = AcquisitionPlan(self.sensor_map(), clock=self.clock)
+        self.policy = SamplingPolicy(self.plan.roles, settings.sample_period, settings.slow_sample_period)
+        self.policy.thresholds = self.policy_thresholds()
+        if settings.logging:
+            from .binlog import BinarySink #imported here so python -m fridge.binlog doesn't find it already loaded by the package
+            #rows are written in batches by a background thread
+            self.log_writer = LogWriter(settings.log_file, ['timestamp(s)'] + self.plan.names + heater_columns(self.Keithley.channels),
+                                        flush_rows=settings.log_flush_rows, flush_interval=settings.log_flush_interval, fsync=settings.log_fsync,
+                                        rotate_bytes=int(settings.log_rotate_mb*1e6), per_run=settings.log_per_run,
+                                        sink=partial(BinarySink, sensors=self.plan.sensors) if settings.log_format == 'binary' else CsvSink)
+        #a previous stop leaves the supply taking safety jobs only
+        self.keithley_io.unrestrict()
+        #ensure VSources off
+        self.keithley(1, output=False, force=True)
+        self.keithley(2, output=False, force=True)
+        self.cancel = CancelToken(self.clock)
+        self.error = None
+        self.run = RecipeRun(self.recipe, self)
+        self.scheduler = DeadlineScheduler(settings.sample_period, self.clock)
+        self.next_heater_read = 0.0
+        if self.clock.virtual: #run_until() does the work of both threads
+            self.recipe_thread = self.sampler = self.subscription = None
+            self.scheduler.start()
+            return
+        self.subscription = self.stream.subscribe()
+        self.recipe_thread = threading.Thread(target=self.recipe_loop, name='Recipe', daemon=True)
+        self.recipe_thread.start()
+        self.sampler = threading.Thread(target=self.sample_loop, name='Sampler', daemon=True)
+        self.sampler.start()
+
+    def stop(self): #Stops sampling and the recipe, turns every output off and closes the log. Returns a StopReport
+        if self.error is not None and self.cancel.cancelled(): #already stopped by an error
+            return self.last_stop
+        requested = self.clock.now()
+        self.cancel.cancel()
+        if self.subscription is not None:
+            self.subscription.close()
+        #Turn all voltage sources off, at most one supply command already under way gets in first
+        report = self.heaters_off(requested)
+        with self.lock: #a recipe step in progress can't get anything but safety jobs through now
+            if self.run is not None:
+                self.run.abort()
+        for thread in (self.recipe_thread, self.sampler):
+            if thread is not None and thread is not threading.current_thread():
+                thread.join(self.settings.stop_timeout)
+        self.last_stop = report
+        self.log_timing()
+        self.close_log()
+        return report
+
+    def failed(self, error): #The sampler or recipe thread has hit an error it can't carry on from - stops everything as stop() does
+        if self.cancel.cancelled(): #already being stopped, the error is most likely the stop's doing
+            return
+        report = self.stop()
+        self.error = error
+        for listener in list(self.error_listeners):
+            listener(error, report)
+
+    def can_jump(self): #Whether next_stage() has a stage to go on to. Doesn't take the lock, it is for the GUI to poll
+        run = self.run
+        return run is not None and not self.cancel.cancelled() and run.can_jump()
+
+    def next_stage(self): #For jumping to the next stage early, eg Stage2 before the head has cooled below the threshold.
+                          #Returns False, doing nothing, before start() or in the last stage
+        with self.lock:
+            return self.can_jump() and self.run.jump()
+
+    def close_devices(self): #Stops the instruments' I/O threads, for when the engine is done with for good
+        for io in (self.keithley_io, self.sim900_io):
+            if io is not None:
+                io.shutdown()
+
+    def close_log(self):
+        if self.log_writer is not None:
+            self.log_writer.close()
+            self.log_writer = None
+
+    def log_timing(self): #Keeps the sampling statistics for the run next to the log
+        if self.settings.logging and self.scheduler is not None:
+            with open(self.settings.log_file + '.timing', 'a') as timing_file:
+                now = time.ctime(self.clock.wall())
+                timing_file.write('{} {}\n'.format(now, self.scheduler.stats.summary()))
+                if self.run is not None and self.run.savings:
+                    timing_file.write('{} {}\n'.format(now, self.savings_summary()))
+                if self.last_stop is not None:
+                    timing_file.write('{} stop: {}\n'.format(now, self.last_stop))
+
+    def savings_summary(self): #Time the recipe's conditions cut from its fixed waits and ramps this run
+        return 'time saved: {} (total {:.0f}s)'.format(', '.join('stage {} step {} {:.0f}s'.format(stage, step, seconds)
+                                                                 for stage, step, seconds in self.run.savings) or 'none', self.run.saved())
+
+    def sample_loop(self): #Sampler thread - reads the thermometers on a fixed schedule and hands each Sample on
+        self.scheduler.start()
+        while not self.cancel.cancelled():
+            try:
+                self.sample_once()
+            except (Cancelled, CancelledError):
+                return
+            except Exception as e: #eg the SIM900 not answering - with nothing watching the fridge the heaters must go off
+                self.failed(e)
+                return
+
+    def sample_once(self): #Waits for the next sample deadline and takes the sample, returns it (None if nothing was due)
+        #waits for the next fixed deadline so the period doesn't stretch with the I/O time
+        timestamp = self.scheduler.wait(self.cancel)
+        #only the sensors the sampling policy says are due get read
+        due = self.policy.due(timestamp)
+        if not due:
+            return None
+        sample = self.acquire(timestamp, due)
+        self.policy.update(timestamp, dict((role, sample[role]) for role in self.plan.roles if sample.fresh(role)))
+        self.stream.publish(sample, self.scheduler.start_time + timestamp)
+        #reads the supply state back every so often in case the cache has drifted
+        self.keithley_io.submit(TELEMETRY, self.Keithley.maybe_resync)
+        self.on_sample(sample)
+        for listener in list(self.listeners):
+            listener(sample)
+        return sample
+
+    def run_until(self, done=None, limit=None):
+        #Virtual clock - runs a started cooldown on the calling thread until done(engine) is true, limit seconds of clock
+        #time have gone by or it is stopped. Samples and recipe steps are taken in deadline order, the clock jumping from
+        #one to the next. Returns True if done() was met.
+        end = None if limit is None else self.clock.now() + limit
+        while not self.cancel.cancelled():
+            if done is not None and done(self):
+                return True
+            if end is not None and self.clock.now() >= end:
+                return False
+            wait = self.run.wait_time()
+            try:
+                if wait is not None and self.clock.now() + wait < self.scheduler.next_deadline():
+                    self.cancel.sleep(wait)
+                    sample = None
+                else:
+                    sample = self.sample_once()
+                    if sample is None:
+                        continue
+                with self.lock:
+                    self.run.step(sample)
+            except (Cancelled, CancelledError):
+                break
+            except Exception as e:
+                self.failed(e)
+                break
+        return False
+
+    def acquire(self, timestamp, due):
+        #the supply's measured outputs are read at a lower rate, on its own I/O thread while the SIM900 is being read
+        heater = None
+        if self.settings.heater_readback_period > 0 and timestamp >= self.next_heater_read:
+            heater = self.keithley_io.submit(TELEMETRY, self.Keithley.measure_all)
+            self.next_heater_read = timestamp + self.settings.heater_readback_period
+        #Reads the sensor map slot by slot, multi-channel modules in one go
+        sample = self.sim900_io.call(TELEMETRY, self.plan.read, self.SIM900, timestamp, due)
+        if heater is not None:
+            try:
+                sample.heater = heater.result()
+            except (ValueError, VisaIOError, CancelledError): #no read back this sample, the temperatures still go out
+                pass
+        return sample
+
+    def on_sample(self, sample): #Logs a sample and resets the SIM921 gain if it needs it
+        if self.log_writer is not None:
+            #sensors that weren't due this sample are left blank
+            self.log_writer.log(['{:.3f}'.format(sample.t)]+['' if temp != temp else repr(temp) for temp in sample.fresh_values()]
+                                +['' if x != x else repr(x) for x in sample.heater_values(self.Keithley.channels)])
+        #This section recalibrates the SIM921 gain settings if the amp gets overloaded (the reader flags it when the reading sticks).
+        #Any role in the sensor map can be on the bridge, so it goes by the flag rather than by name
+        for role in self.plan.roles:
+            if sample.flags(role) & OVERLOAD:
+                self.sim900_io.submit(CONTROL, self.SIM900.write, self.plan.sensor(role).slot, 'AGAI ON')
+
+    def recipe_loop(self): #Recipe thread - runs every stage, woken by each new sample and whenever a step falls due in between
+        while True:
+            try:
+                sample = self.subscription.get(self.run.wait_time())
+            except StreamClosed:
+                return
+            with self.lock:
+                if self.cancel.cancelled():
+                    return
+                try:
+                    self.run.step(sample)
+                except CancelledError: #the supply stopped taking control jobs, the run is being stopped
+                    return
+                except Exception as e: #eg the supply not answering a step's command
+                    self.failed(e)
+                    return
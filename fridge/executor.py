@@ -0,0 +1,106 @@
+#Single owner I/O worker - one thread per physical instrument does all of its I/O, taking jobs from a priority queue,
+#so commands from the GUI, the sampler and the control loops can't interleave on the bus
+
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+#Priorities, lowest number runs first
+SAFETY = 0 #heater shutoff
+CONTROL = 1 #control writes
+TELEMETRY = 2 #temperature and read-back queries
+PRIORITY_NAMES = {SAFETY: 'safety', CONTROL: 'control', TELEMETRY: 'telemetry'}
+
+class LatencyStats(object): #Submit-to-done latency of one priority, seconds
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self.worst_wait = 0.0 #time spent queued behind other jobs
+
+    def record(self, wait, latency):
+        self.count += 1
+        self.total += latency
+        self.worst = max(self.worst, latency)
+        self.worst_wait = max(self.worst_wait, wait)
+
+    def mean(self):
+        return self.total/self.count if self.count else 0.0
+
+
+class InstrumentExecutor(object):
+    #Jobs are callables run one at a time on the worker thread in priority order (first come first served within a
+    #priority) and submit() hands back a Future. A job already running isn't interrupted, so a safety job waits at most
+    #for the one I/O job in progress.
+    def __init__(self, name):
+        self.name = name
+        self.queue = queue.PriorityQueue()
+        self.order = itertools.count()
+        self.stats = dict((priority, LatencyStats()) for priority in PRIORITY_NAMES)
+        self.lock = threading.Lock() #so nothing can slip into the queue between restrict() clearing it and the safety job behind it
+        self.refuse_above = None
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, priority, fn, *args, **kwargs): #Jobs less urgent than restrict() allows come back already cancelled
+        future = Future()
+        with self.lock:
+            if self.refuse_above is not None and priority > self.refuse_above:
+                future.cancel()
+            else:
+                self.queue.put((priority, next(self.order), time.monotonic(), future, fn, args, kwargs))
+        return future
+
+    def call(self, priority, fn, *args, **kwargs): #submit and wait for the result
+        return self.submit(priority, fn, *args, **kwargs).result()
+
+    def restrict(self, above=SAFETY): #Drops queued jobs less urgent than the given priority and refuses new ones until unrestrict()
+        with self.lock:
+            self.refuse_above = above
+            return self.cancel_pending(above)
+
+    def unrestrict(self):
+        with self.lock:
+            self.refuse_above = None
+
+    def cancel_pending(self, above=SAFETY): #Drops queued jobs less urgent than the given priority, returns how many
+        kept = []
+        dropped = 0
+        while True:
+            try:
+                job = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if job[0] > above and job[3] is not None:
+                job[3].cancel()
+                dropped += 1
+            else:
+                kept.append(job)
+        for job in kept:
+            self.queue.put(job)
+        return dropped
+
+    def shutdown(self, wait=True): #Runs what is already queued then stops the worker
+        self.queue.put((float('inf'), next(self.order), time.monotonic(), None, None, (), {}))
+        if wait:
+            self.thread.join()
+
+    def summary(self): #Worst case latency per priority in ms
+        return ', '.join('{} {:.0f}ms'.format(PRIORITY_NAMES[p], self.stats[p].worst*1e3) for p in sorted(PRIORITY_NAMES))
+
+    def run(self):
+        while True:
+            priority, order, submitted, future, fn, args, kwargs = self.queue.get()
+            if future is None:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.monotonic()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            if priority in self.stats:
+                self.stats[priority].record(started - submitted, time.monotonic() - submitted)
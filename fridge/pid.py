@@ -0,0 +1,47 @@
+#PID controller for holding a temperature with a heater. The output is heater power, so the loop gain doesn't change with
+#the operating point the way it would driving the voltage (P = V^2/R); volts_for() turns it into a supply voltage.
+
+import math
+
+class PID(object):
+    #Derivative is taken on the measurement rather than the error so a setpoint change doesn't kick the output. Anti-windup
+    #is by conditional integration: while the output is pinned at a limit the integral only moves in the direction that
+    #brings it back off the limit. feedforward is the power expected to hold the setpoint, added before the limits.
+    def __init__(self, kp, ki, kd, setpoint, out_min=0.0, out_max=1.0, feedforward=0.0):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.setpoint = setpoint
+        self.out_min = out_min
+        self.out_max = out_max
+        self.feedforward = feedforward
+        self.reset()
+
+    def reset(self, output=None): #Forgets the history, output= starts the integral so the first output matches it (bumpless)
+        self.integral = 0.0 if output is None else output - self.feedforward
+        self.last_measurement = None
+        self.last_t = None
+        self.error = 0.0
+        self.p = 0.0
+        self.d = 0.0
+        self.output = output if output is not None else self.out_min
+
+    def update(self, measurement, t): #New measurement taken at time t (seconds), returns the output
+        error = self.setpoint - measurement
+        dt = t - self.last_t if self.last_t is not None else 0.0
+        self.p = self.kp*error
+        self.d = -self.kd*(measurement - self.last_measurement)/dt if dt > 0 else 0.0
+        integral = self.integral + self.ki*error*dt
+        unclamped = self.feedforward + self.p + integral + self.d
+        output = min(max(unclamped, self.out_min), self.out_max)
+        if output == unclamped or (unclamped > self.out_max and error < 0) or (unclamped < self.out_min and error > 0):
+            self.integral = integral
+        self.error = error
+        self.last_measurement = measurement
+        self.last_t = t
+        self.output = output
+        return output
+
+
+def volts_for(power, ohms): #Supply voltage that puts the given power into a heater
+    return math.sqrt(max(power, 0.0)*ohms)
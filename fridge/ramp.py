@@ -0,0 +1,86 @@
+#Heater voltage ramps. When the supply has a list mode the whole ramp is programmed into it and only checked now and
+#then; otherwise the host steps it, working the voltage out from the elapsed time so a late step catches up rather
+#than stretching the ramp.
+
+from .clock import MonotonicClock
+from .executor import SAFETY, CONTROL, TELEMETRY
+
+class Ramp(object):
+    def __init__(self, keithley, io, channel, start, target, duration, step=1.0, check_interval=10.0, use_list=True, clock=None):
+        self.keithley = keithley
+        self.io = io #InstrumentExecutor that owns the supply
+        self.channel = channel
+        self.start_volt = start
+        self.target = target
+        self.duration = duration
+        self.step = step #seconds between host steps
+        self.check_interval = check_interval #seconds between list progress checks
+        self.use_list = use_list
+        self.clock = clock if clock is not None else MonotonicClock()
+        self.mode = None #'list' or 'host' once started
+        self.started = None
+        self.next_poll = None
+        self.done = False
+        self.writes = 0
+
+    def voltage_at(self, now):
+        fraction = min(max((now - self.started)/self.duration, 0.0), 1.0) if self.duration > 0 else 1.0
+        return self.start_volt + fraction*(self.target - self.start_volt)
+
+    def begin(self):
+        self.started = self.clock.now()
+        self.mode = 'host'
+        if self.use_list and self.duration > 0 and self.io.call(CONTROL, self.keithley.has_list_mode):
+            steps = min(self.keithley.list_steps, max(1, int(round(self.duration/self.step))))
+            volts = [self.start_volt + (i + 1)*(self.target - self.start_volt)/steps for i in range(steps)]
+            if self.io.call(CONTROL, self.keithley.run_list, self.channel, volts, self.duration/steps):
+                self.mode = 'list'
+                self.writes += 1
+        self.next_poll = self.started
+        return self.mode
+
+    def poll(self): #Does whatever is due now, returns True once the ramp has finished
+        if self.done:
+            return True
+        if self.started is None:
+            self.begin()
+        now = self.clock.now()
+        if now < self.next_poll:
+            return False
+        finished = now - self.started >= self.duration
+        if self.mode == 'host':
+            self.io.call(CONTROL, self.keithley.set, self.channel, volt=self.voltage_at(now))
+            self.writes += 1
+            self.next_poll += self.step
+            if self.next_poll < now: #fell behind, carry on from now rather than firing a burst of steps
+                self.next_poll = now + self.step
+        else:
+            if finished or not self.io.call(TELEMETRY, self.keithley.list_running, self.channel):
+                finished = True
+            self.next_poll = min(now + self.check_interval, self.started + self.duration)
+        if finished:
+            #pin the final setpoint so the supply and the cache agree however the ramp got there
+            self.io.call(CONTROL, self.keithley.set, self.channel, volt=self.target, force=True)
+            self.writes += 1
+            self.done = True
+        return self.done
+
+    def wait_time(self): #Seconds until the next poll is due
+        if self.next_poll is None:
+            return 0.0
+        return max(0.0, self.next_poll - self.clock.now())
+
+    def finish(self): #Ends the ramp early at its target
+        if self.done:
+            return
+        if self.mode == 'list':
+            self.io.call(CONTROL, self.keithley.stop_list, self.channel)
+        self.io.call(CONTROL, self.keithley.set, self.channel, volt=self.target, force=True)
+        self.writes += 1
+        self.done = True
+
+    def abort(self):
+        if self.mode == 'list' and not self.done:
+            #safety priority so a stop still gets through when the supply's queue is only taking safety jobs
+            self.io.call(SAFETY, self.keithley.stop_list, self.channel)
+        self.done = True
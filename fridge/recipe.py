@@ -0,0 +1,490 @@
+#Cooldown recipes - the stages of a cooldown, what each one does to the heaters and when it hands over to the next, as
+#JSON (see recipes/gl4.json). A RecipeRun steps through one recipe as a state machine; it never blocks, so a single thread
+#can drive every stage by calling step() with each new sample and whenever wait_time() runs out.
+#
+#A recipe is {"name": ..., "stages": [stage, ...]} and each stage is
+#    {"name": "1", "policy": 1, "steps": [step, ...], "until": condition, "exit": [step, ...], "next": "2"}
+#Steps run one after the other: {"type": "set", "channel": 1, "volt": 0, "output": true} (any of volt/curr/output),
+#{"type": "wait", "seconds": 300}, {"type": "ramp", "channel": 1, "from": 0, "to": 25, "duration": 300} and
+#{"type": "hysteresis", "channel": 1, "sensor": "pump", "above": 48, "off": {...}, "below": 47, "on": {...}}, which never
+#finishes and only turns the heater back on once it has turned it off, and {"type": "pid", "channel": 1, "sensor": "pump"}
+#which holds the sensor at pid_setpoint with the PID settings (any of them can be given in the step instead) until the
+#stage ends, and {"type": "adaptive_ramp", "channel": 2, "to": 6, "sensor": "heat_switch", "guard": "mainplate"} which steps
+#the voltage up as fast as the sensor it heats follows, within hs_max_power, backing off while the guard sensor is too warm or
+#warming too fast (the hs_ settings, or the same names without hs_ in the step). The stage moves on when its until condition is met,
+#{"sensor": "head", "below": 4.2} / {"sensor": ..., "above": ...} / {"after": seconds} / {"all": [...]} / {"any": [...]},
+#or {"sensor": "pump", "cooling_faster": K/s} / {"sensor": ..., "cooling_slower": K/s} on the slope of the last rate_window
+#seconds of readings, or, without one, when its last step is done. A wait or ramp step can have an until condition of its
+#own too, its seconds/duration is then only the longest it takes - a ramp that ends early jumps to its target - and the
+#time saved is kept in RecipeRun.savings. "exit" steps are sets run on the way out. Anywhere a number goes the name of a
+#setting can be given instead, eg "CDStage1_ThHold".
+
+import json
+from collections import deque
+from .ramp import Ramp
+from .pid import PID, volts_for
+from .datalog import LogWriter
+
+class Recipe(object):
+    def __init__(self, stages, name=''):
+        self.name = name
+        self.stages = list(stages)
+        self.names = [stage['name'] for stage in self.stages]
+        for stage in self.stages:
+            for step in stage.get('steps', []) + stage.get('exit', []):
+                if step.get('type') not in STEP_TYPES:
+                    raise ValueError('Unknown step {!r} in stage {!r}'.format(step.get('type'), stage['name']))
+            for step in stage.get('exit', []):
+                if step['type'] != 'set':
+                    raise ValueError('Only set steps can be used on exit from stage {!r}'.format(stage['name']))
+            if stage.get('next') is not None and stage['next'] not in self.names:
+                raise ValueError('Stage {!r} goes on to unknown stage {!r}'.format(stage['name'], stage['next']))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as recipe_file:
+            recipe = json.load(recipe_file)
+        return cls(recipe['stages'], recipe.get('name', ''))
+
+    def stage(self, name):
+        return self.stages[self.names.index(name)]
+
+    def next_stage(self, name): #The stage after this one - its "next" or else the following stage in the list, None at the end
+        stage = self.stage(name)
+        if 'next' in stage:
+            return stage['next']
+        position = self.names.index(name) + 1
+        return self.names[position] if position < len(self.names) else None
+
+    def thresholds(self, settings): #role -> the temperatures the recipe acts on, so the sampler watches them closely
+        found = {}
+        def add(role, value):
+            found.setdefault(role, [])
+            if value not in found[role]:
+                found[role].append(value)
+        def conditions(condition):
+            for part in condition.get('all', []) + condition.get('any', []):
+                conditions(part)
+            for key in ('above', 'below'):
+                if 'sensor' in condition and key in condition:
+                    add(condition['sensor'], resolve(condition[key], settings))
+        for stage in self.stages:
+            conditions(stage.get('until', {}))
+            for step in stage.get('steps', []):
+                conditions(step.get('until', {}))
+                if step['type'] == 'hysteresis':
+                    add(step['sensor'], resolve(step['below'], settings))
+                    add(step['sensor'], resolve(step['above'], settings))
+                elif step['type'] == 'pid':
+                    add(step['sensor'], resolve(step.get('setpoint', 'pid_setpoint'), settings))
+        return found
+
+
+def resolve(value, settings): #A number from a recipe, or the setting it names
+    if isinstance(value, str):
+        return getattr(settings, value)
+    return value
+
+
+def met(condition, sample, elapsed, run): #Whether an until condition holds for this sample, elapsed seconds into the stage or step
+    settings = run.settings
+    if 'all' in condition:
+        return all(met(part, sample, elapsed, run) for part in condition['all'])
+    if 'any' in condition:
+        return any(met(part, sample, elapsed, run) for part in condition['any'])
+    if 'after' in condition:
+        return elapsed >= resolve(condition['after'], settings)
+    if sample is None:
+        return False
+    value = sample[condition['sensor']]
+    if 'above' in condition and not value > resolve(condition['above'], settings):
+        return False
+    if 'below' in condition and not value < resolve(condition['below'], settings):
+        return False
+    if 'cooling_faster' in condition or 'cooling_slower' in condition:
+        rate = run.rate(condition['sensor'])
+        if rate is None:
+            return False
+        if 'cooling_faster' in condition and not -rate > resolve(condition['cooling_faster'], settings):
+            return False
+        if 'cooling_slower' in condition and not -rate < resolve(condition['cooling_slower'], settings):
+            return False
+    return True
+
+
+def setpoints(step, settings): #volt/curr/output keywords for Keithley2230G.set from a set step or a hysteresis action
+    return dict((key, resolve(step[key], settings)) for key in ('volt', 'curr', 'output') if key in step)
+
+
+class SetStep(object):
+    def __init__(self, step, run):
+        self.channel = step['channel']
+        self.settings = setpoints(step, run.settings)
+
+    def poll(self, run, sample, now):
+        run.keithley(self.channel, **self.settings)
+        return True
+
+    def wait_time(self, now):
+        return 0.0
+
+    def planned(self):
+        return None
+
+    def finish(self, run):
+        pass
+
+    def abort(self, run):
+        pass
+
+
+class WaitStep(object):
+    def __init__(self, step, run):
+        self.seconds = resolve(step['seconds'], run.settings)
+        self.until = None
+
+    def poll(self, run, sample, now):
+        if self.until is None:
+            self.until = now + self.seconds
+        return now >= self.until
+
+    def wait_time(self, now):
+        return 0.0 if self.until is None else max(0.0, self.until - now)
+
+    def planned(self): #Seconds the step takes if its until condition never comes
+        return self.seconds
+
+    def finish(self, run):
+        pass
+
+    def abort(self, run):
+        pass
+
+
+class RampStep(object):
+    def __init__(self, step, run):
+        settings = run.settings
+        self.ramp = Ramp(run.Keithley, run.keithley_io, step['channel'], resolve(step.get('from', 0), settings), resolve(step['to'], settings),
+                         resolve(step['duration'], settings), use_list=settings.ramp_list_mode, clock=run.clock)
+
+    def poll(self, run, sample, now):
+        return self.ramp.poll()
+
+    def wait_time(self, now):
+        return self.ramp.wait_time()
+
+    def planned(self):
+        return self.ramp.duration
+
+    def finish(self, run):
+        self.ramp.finish()
+
+    def abort(self, run):
+        self.ramp.abort()
+
+
+class HysteresisStep(object): #Keeps a heater between two temperatures until the stage ends
+    def __init__(self, step, run):
+        settings = run.settings
+        self.channel = step['channel']
+        self.sensor = step['sensor']
+        self.above = resolve(step['above'], settings)
+        self.below = resolve(step['below'], settings)
+        self.off = setpoints(step.get('off', {'output': False}), settings)
+        self.on = setpoints(step['on'], settings)
+        self.initial_ramp = True #left alone below the band until it has first gone over it
+
+    def poll(self, run, sample, now):
+        if sample is None or not sample.fresh(self.sensor):
+            return False
+        temp = sample[self.sensor]
+        if temp > self.above:
+            run.keithley(self.channel, **self.off)
+            self.initial_ramp = False
+        elif temp < self.below and not self.initial_ramp:
+            run.keithley(self.channel, **self.on)
+        return False
+
+    def wait_time(self, now):
+        return None
+
+    def planned(self):
+        return None
+
+    def finish(self, run):
+        pass
+
+    def abort(self, run):
+        pass
+
+
+class PIDStep(object): #Holds a sensor at a setpoint by setting a heater's power on every fresh reading, until the stage ends
+    log_header = ['timestamp(s)', 'setpoint(K)', 'measured(K)', 'error(K)', 'p(W)', 'i(W)', 'd(W)', 'power(W)', 'volts(V)', 'latency(s)']
+
+    def __init__(self, step, run):
+        settings = run.settings
+        def get(key):
+            return resolve(step.get(key, 'pid_' + key), settings)
+        self.channel = step['channel']
+        self.sensor = step['sensor']
+        self.ohms = get('heater_ohms')
+        self.pid = PID(get('kp'), get('ki'), get('kd'), get('setpoint'), 0.0, get('max_power'), get('feedforward'))
+        #error, output and loop latency (sample taken to heater set) for tuning, written in the background like the main log
+        log_file = step.get('log', settings.pid_log_file)
+        self.log = LogWriter(log_file, self.log_header) if log_file else None
+        self.started = False
+
+    def poll(self, run, sample, now):
+        if sample is None or not sample.fresh(self.sensor):
+            return False
+        if not self.started:
+            #picks up from whatever the heater was left at (eg the end of a ramp) rather than jumping
+            state = run.Keithley.state.get(self.channel, {})
+            if state.get('CHAN:OUTP') and state.get('VOLT'):
+                self.pid.reset(state['VOLT']**2/self.ohms)
+            run.keithley(self.channel, output=True)
+            self.started = True
+        power = self.pid.update(sample[self.sensor], sample.t)
+        volts = volts_for(power, self.ohms)
+        run.keithley(self.channel, volt=volts)
+        if self.log is not None:
+            pid = self.pid
+            self.log.log(['{:.3f}'.format(sample.t)] + [repr(x) for x in (pid.setpoint, sample[self.sensor], pid.error, pid.p, pid.integral,
+                                                                          pid.d, power, volts, run.sample_age(sample))])
+        return False
+
+    def wait_time(self, now):
+        return None
+
+    def planned(self):
+        return None
+
+    def finish(self, run):
+        self.abort(run)
+
+    def abort(self, run):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+
+class AdaptiveRampStep(object):
+    #Raises a heater voltage a step at a time, the next step going in once the sensor it heats has settled (its slope over
+    #the rate window is under settle_rate) or max_dwell has passed, so the ramp runs as fast as the thermal response allows.
+    #The voltage never goes past what gives max_power - worked out from the measured volts and amps when the supply is being
+    #read back - and while the guard sensor is above guard_max or warming faster than guard_rate (either can be null to
+    #leave it out) it is stepped back down instead. The steps themselves warm the guard, so after a backoff the ramp only
+    #goes up again once the guard has stayed clear for a whole rate window, otherwise it swings up and down around the
+    #voltage that sets the guard off.
+    def __init__(self, step, run):
+        settings = run.settings
+        def get(key):
+            return resolve(step.get(key, 'hs_' + key), settings)
+        self.channel = step['channel']
+        self.sensor = step['sensor']
+        self.guard = step.get('guard')
+        self.target = resolve(step['to'], settings)
+        self.volts = resolve(step.get('from', 0), settings)
+        self.step_volts = get('step_volts')
+        self.settle_rate = get('settle_rate')
+        self.min_dwell = get('min_dwell')
+        self.max_dwell = get('max_dwell')
+        self.max_power = get('max_power')
+        self.ohms = get('heater_ohms')
+        self.guard_rate = get('guard_rate')
+        self.guard_max = get('guard_max')
+        self.backoff_volts = get('backoff_volts')
+        self.rate_window = settings.rate_window
+        self.last_change = None
+        self.backoffs = 0
+        self.backed_off = False
+        self.guard_quiet = None #when the guard last went clear after a backoff
+
+    def limit(self, sample): #Highest voltage allowed, from the heater's measured resistance if there is a read back
+        ohms = self.ohms
+        if sample.heater is not None:
+            volts, amps = sample.heater[self.channel - 1]
+            if amps > 1e-4 and volts > 0.1:
+                ohms = volts/amps
+        return min(self.target, volts_for(self.max_power, ohms))
+
+    def guarded(self, run, sample): #Whether the guard sensor is above guard_max or warming faster than guard_rate
+        if self.guard is None:
+            return False
+        if self.guard_max is not None and sample.fresh(self.guard) and sample[self.guard] > self.guard_max:
+            return True
+        rate = run.rate(self.guard) if self.guard_rate is not None else None
+        return rate is not None and rate > self.guard_rate
+
+    def change(self, run, volts, now):
+        self.volts = volts
+        run.keithley(self.channel, volt=volts, output=True)
+        self.last_change = now
+
+    def poll(self, run, sample, now):
+        if self.last_change is None:
+            self.change(run, self.volts, now)
+            return False
+        if sample is None:
+            return False
+        dwell = now - self.last_change
+        if self.guarded(run, sample):
+            if dwell >= self.min_dwell and self.volts > 0:
+                self.change(run, max(0.0, self.volts - self.backoff_volts), now)
+                self.backoffs += 1
+            self.backed_off = self.backoffs > 0
+            self.guard_quiet = None
+            return False
+        if self.backed_off:
+            if self.guard_quiet is None:
+                self.guard_quiet = now
+            if now - self.guard_quiet < self.rate_window:
+                return False
+            self.backed_off = False
+        limit = self.limit(sample)
+        if self.volts >= limit:
+            return True
+        rate = run.rate(self.sensor)
+        if dwell >= self.max_dwell or (dwell >= self.min_dwell and rate is not None and abs(rate) < self.settle_rate):
+            self.change(run, min(self.volts + self.step_volts, limit), now)
+        return False
+
+    def wait_time(self, now):
+        return None
+
+    def planned(self):
+        return None
+
+    def finish(self, run): #Ends the ramp early at its target, within max_power on the nominal heater resistance
+        self.change(run, min(self.target, volts_for(self.max_power, self.ohms)), run.clock.now())
+
+    def abort(self, run):
+        pass
+
+
+STEP_TYPES = {'set': SetStep, 'wait': WaitStep, 'ramp': RampStep, 'hysteresis': HysteresisStep, 'pid': PIDStep,
+              'adaptive_ramp': AdaptiveRampStep}
+
+class RecipeRun(object):
+    #One pass through a recipe. The engine supplies the instruments (Keithley, keithley_io, keithley(...)), the settings
+    #and the sampling policy; step() and jump() are never called at the same time. Times come off the engine's clock
+    #unless another is given.
+    def __init__(self, recipe, engine, clock=None):
+        self.recipe = recipe
+        self.engine = engine
+        self.settings = engine.settings
+        self.Keithley = engine.Keithley
+        self.keithley_io = engine.keithley_io
+        self.clock = clock if clock is not None else engine.clock
+        self.stage = None #name of the stage running, None before the first sample and after the last stage
+        self.finished = False
+        self.entered = None
+        self.steps = []
+        self.specs = []
+        self.position = 0
+        self.step_started = None
+        self.history = [] #(stage, seconds since the run started) as each stage was entered
+        self.savings = [] #(stage, step number, seconds saved) for each wait or ramp its until condition cut short
+        self.readings = {} #role -> recent (t, value) for the cooling rate conditions
+
+    def keithley(self, channel, **settings):
+        return self.engine.keithley(channel, **settings)
+
+    def sample_age(self, sample): #Seconds since the reads for a sample started
+        return self.engine.sample_age(sample)
+
+    def track(self, sample): #Keeps the last rate_window seconds of fresh readings of every sensor
+        for role in sample.index:
+            if sample.fresh(role):
+                readings = self.readings.setdefault(role, deque())
+                readings.append((sample.t, sample[role]))
+                while readings[0][0] < sample.t - self.settings.rate_window:
+                    readings.popleft()
+
+    def rate(self, role): #Least squares slope of a sensor over the rate window in K/s, None until there is enough to go on
+        readings = self.readings.get(role, ())
+        if len(readings) < 3 or readings[-1][0] - readings[0][0] < self.settings.rate_window/2:
+            return None
+        mean_t = sum(t for t, value in readings)/len(readings)
+        mean_value = sum(value for t, value in readings)/len(readings)
+        spread = sum((t - mean_t)**2 for t, value in readings)
+        return sum((t - mean_t)*(value - mean_value) for t, value in readings)/spread
+
+    def enter(self, name, now):
+        if self.stage is not None:
+            if self.position < len(self.steps):
+                self.current().abort(self)
+            for step in self.recipe.stage(self.stage).get('exit', []):
+                SetStep(step, self).poll(self, None, now)
+        self.stage = name
+        if name is None:
+            self.finished = True
+            return
+        stage = self.recipe.stage(name)
+        self.entered = now
+        self.specs = stage.get('steps', [])
+        self.steps = [STEP_TYPES[step['type']](step, self) for step in self.specs]
+        self.position = 0
+        self.step_started = now
+        self.history.append((name, now))
+        self.engine.policy.stage = stage.get('policy', 0)
+
+    def current(self):
+        return self.steps[self.position]
+
+    def step(self, sample): #Moves the recipe on with a new sample, or None when woken because a step is due
+        if self.finished:
+            return
+        now = self.clock.now()
+        if sample is not None:
+            self.track(sample)
+        if self.stage is None:
+            if sample is None:
+                return
+            self.enter(self.recipe.names[0], now)
+        stage = self.recipe.stage(self.stage)
+        if 'until' in stage and met(stage['until'], sample, now - self.entered, self):
+            self.enter(self.recipe.next_stage(self.stage), now)
+            return
+        while self.position < len(self.steps):
+            spec = self.specs[self.position]
+            if 'until' in spec and met(spec['until'], sample, now - self.step_started, self):
+                self.cut_short(now)
+            elif not self.current().poll(self, sample, now):
+                break
+            self.position += 1
+            self.step_started = now
+        if self.position == len(self.steps) and 'until' not in stage:
+            self.enter(self.recipe.next_stage(self.stage), now)
+
+    def cut_short(self, now): #A step's own until condition came before its time was up
+        step = self.current()
+        step.finish(self)
+        if step.planned() is not None:
+            self.savings.append((self.stage, self.position + 1, max(0.0, step.planned() - (now - self.step_started))))
+
+    def saved(self): #Total seconds the until conditions have saved so far
+        return sum(seconds for stage, step, seconds in self.savings)
+
+    def can_jump(self): #Whether there is a stage running with another after it to jump to
+        return not self.finished and self.stage is not None and self.recipe.next_stage(self.stage) is not None
+
+    def jump(self): #Leaves the current stage straight away for the next one, returns False (doing nothing) from the last stage
+        if not self.can_jump():
+            return False
+        #the step under way is finished rather than aborted, so a ramp cut short goes to its target instead of staying partway
+        if self.position < len(self.steps):
+            self.current().finish(self)
+            self.position = len(self.steps)
+        self.enter(self.recipe.next_stage(self.stage), self.clock.now())
+        return True
+
+    def wait_time(self): #Seconds until step() needs calling without a new sample, None if the next sample will do
+        if self.finished or self.stage is None or self.position == len(self.steps):
+            return None
+        return self.current().wait_time(self.clock.now())
+
+    def abort(self): #Stops whatever step is running, leaving the heaters where they are for the caller to turn off
+        if self.stage is not None and self.position < len(self.steps):
+            self.current().abort(self)
+        self.finished = True
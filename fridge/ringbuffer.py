@@ -0,0 +1,39 @@
+#Fixed size sample history - preallocated float64 arrays written in place, so memory use is constant however long the run
+
+from array import array
+
+class RingBuffer(object): #Timestamps plus one column per sensor, the oldest samples are overwritten once it is full
+    def __init__(self, columns, capacity):
+        self.columns = list(columns)
+        self.capacity = capacity
+        self.times = array('d', [0.0])*capacity
+        self.data = [array('d', [float('nan')])*capacity for c in self.columns]
+        self.next = 0 #index the next sample is written to
+        self.count = 0
+        self.version = 0 #bumped on every append so readers can tell if anything changed
+
+    def __len__(self):
+        return self.count
+
+    def append(self, t, values): #values in column order, NaN for a sensor not read this sample
+        i = self.next
+        self.times[i] = t
+        for column, value in zip(self.data, values):
+            column[i] = value
+        self.next = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.version += 1
+
+    def ordered(self, values): #Copy of one of the arrays, oldest sample first
+        if self.count < self.capacity:
+            return values[:self.count]
+        return values[self.next:] + values[:self.next]
+
+    def view(self): #(times, [column values]) oldest first
+        return self.ordered(self.times), [self.ordered(column) for column in self.data]
+
+    def latest(self):
+        if not self.count:
+            return None
+        i = (self.next - 1) % self.capacity
+        return self.times[i], [column[i] for column in self.data]
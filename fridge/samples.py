@@ -0,0 +1,66 @@
+#Sample records - replies are parsed and checked once where they are read and the same record is then shared by the GUI,
+#the logger and the control loops
+
+NAN = float('nan')
+
+#Status flags, per sensor
+OK = 0
+STALE = 1 #not read this sample, the value is the last good reading
+PARSE_ERROR = 2 #reply wasn't a number
+OVERLOAD = 4 #SIM921 has given exactly the same reading too many times in a row, its gain needs resetting
+
+def parse_reply(reply): #(value, status) for one reply string from a thermometer module
+    try:
+        value = float(reply)
+    except (TypeError, ValueError):
+        return NAN, PARSE_ERROR
+    if value != value:
+        return NAN, PARSE_ERROR
+    return value, OK
+
+
+class Sample(object): #One acquisition - time since the start of the run, a float and a status per sensor, in sensor map order
+    __slots__ = ('t', 'index', 'values', 'status', 'heater')
+
+    def __init__(self, t, index, values, status, heater=None):
+        self.t = t
+        self.index = index #role -> position, shared by every sample from the same plan
+        self.values = values
+        self.status = status
+        self.heater = heater #measured (volts, amps) per supply channel, None if not read back this sample
+
+    def __getitem__(self, role):
+        return self.values[self.index[role]]
+
+    def __contains__(self, role):
+        return role in self.index
+
+    def flags(self, role):
+        return self.status[self.index[role]]
+
+    def fresh(self, role): #Read this sample and a valid number
+        return self.status[self.index[role]] & (STALE | PARSE_ERROR) == 0
+
+    def fresh_values(self): #Values with NaN for anything not read this sample, for logs and plots
+        return [value if status & (STALE | PARSE_ERROR) == 0 else NAN for value, status in zip(self.values, self.status)]
+
+    def heater_values(self, channels): #Flat [V1, I1, V2, I2, ...] for logs, NaN if not read back this sample
+        if self.heater is None:
+            return [NAN]*(2*channels)
+        return [x for reading in self.heater for x in reading]
+
+    def __repr__(self):
+        return 'Sample({:.3f}, {})'.format(self.t, dict((role, self.values[i]) for role, i in self.index.items()))
+
+
+def heater_columns(channels):
+    return [name.format(channel) for channel in range(1, channels + 1) for name in ('ch{}_volt(V)', 'ch{}_curr(A)')]
+
+
+def open_heaters(heater, state, min_volts=0.5, min_amps=1e-3):
+    #Channels switched on with a real voltage across them but next to no current - a heater or its wiring is open.
+    #state is the supply driver's cached {channel: {'CHAN:OUTP': ...}}.
+    if heater is None:
+        return []
+    return [channel for channel, (volts, amps) in enumerate(heater, 1)
+            if state.get(channel, {}).get('CHAN:OUTP') and volts > min_volts and amps < min_amps]
@@ -0,0 +1,129 @@
+#Fixed rate loop timing - deadlines come off a monotonic clock so the sample period doesn't drift with the I/O time
+
+import math
+from .clock import MonotonicClock
+
+class TimingStats(object): #Running period, jitter and overrun figures for a fixed rate loop
+    def __init__(self, period):
+        self.period = period
+        self.ticks = 0
+        self.skipped = 0
+        self.overruns = 0
+        self.max_late = 0.0
+        self.last_tick = None
+        self.intervals = 0
+        self.mean_period = 0.0
+        self.m2 = 0.0
+
+    def record(self, tick_time, late):
+        self.ticks += 1
+        self.max_late = max(self.max_late, late)
+        if self.last_tick is not None: #Welford's running mean/variance of the real period
+            interval = tick_time - self.last_tick
+            self.intervals += 1
+            delta = interval - self.mean_period
+            self.mean_period += delta/self.intervals
+            self.m2 += delta*(interval - self.mean_period)
+        self.last_tick = tick_time
+
+    def jitter(self): #Standard deviation of the real period, seconds
+        if self.intervals < 2:
+            return 0.0
+        return math.sqrt(self.m2/(self.intervals - 1))
+
+    def summary(self):
+        return 'period {:.3f}s, jitter {:.1f}ms, max late {:.1f}ms, {} overruns, {} skipped of {}'.format(
+            self.mean_period or self.period, self.jitter()*1e3, self.max_late*1e3, self.overruns, self.skipped, self.ticks + self.skipped)
+
+
+class DeadlineScheduler(object): #Wakes at start + n*period. If the loop falls a whole period behind the missed cycles are skipped and counted
+    def __init__(self, period, clock=None):
+        self.period = period
+        self.clock = clock if clock is not None else MonotonicClock()
+        self.stats = TimingStats(period)
+        self.start_time = None
+        self.tick = 0
+
+    def start(self):
+        self.start_time = self.clock.now()
+        self.tick = 0
+        self.stats = TimingStats(self.period)
+
+    def elapsed(self):
+        return self.clock.now() - self.start_time
+
+    def next_deadline(self): #Clock time the next wait() wakes at, unless the loop is running late
+        return self.start_time + (self.tick + 1)*self.period
+
+    def wait(self, cancel=None): #Sleeps until the next deadline and returns the time since start that it woke at
+                                 #With a CancelToken the sleep ends in Cancelled as soon as it is cancelled
+        if self.start_time is None:
+            self.start()
+        self.tick += 1
+        deadline = self.start_time + self.tick*self.period
+        now = self.clock.now()
+        if now >= deadline + self.period:
+            missed = int((now - deadline)//self.period)
+            self.tick += missed
+            self.stats.skipped += missed
+            deadline += missed*self.period
+        if now < deadline:
+            (cancel.sleep if cancel is not None else self.clock.sleep)(deadline - now)
+        else:
+            self.stats.overruns += 1
+        woke = self.clock.now()
+        self.stats.record(woke, woke - deadline)
+        return woke - self.start_time
+
+
+class SamplingPolicy(object):
+    #Decides which sensors are due on each scheduler tick. Every sensor has a normal interval for the current cooldown stage,
+    #drops to the fast (scheduler) period when it is close to a stage threshold or changing quickly, and backs off to the
+    #slow period when it has gone flat.
+    def __init__(self, roles, fast_period, slow_period, stage_intervals=None):
+        self.roles = list(roles)
+        self.fast_period = fast_period
+        self.slow_period = slow_period
+        self.stage_intervals = stage_intervals if stage_intervals is not None else default_stage_intervals(fast_period, slow_period)
+        self.stage = 0
+        self.thresholds = {} #role -> temperatures that trigger a stage change or control action
+        self.margin = 0.1 #fraction of a threshold that counts as close to it
+        self.fast_rate = 0.05 #K/s
+        self.flat_rate = 0.001 #K/s
+        self.next_due = dict((role, 0.0) for role in self.roles)
+        self.previous = {}
+        self.rates = {}
+
+    def interval(self, role): #Current poll interval for a sensor, seconds
+        value = self.previous.get(role, (None, None))[1]
+        rate = self.rates.get(role)
+        if value is not None:
+            for threshold in self.thresholds.get(role, ()):
+                if abs(value - threshold) <= self.margin*abs(threshold):
+                    return self.fast_period
+        if rate is not None and rate > self.fast_rate:
+            return self.fast_period
+        if rate is not None and rate < self.flat_rate:
+            return self.slow_period
+        return self.stage_intervals.get(self.stage, {}).get(role, self.fast_period)
+
+    def due(self, now): #Roles to read at this tick, a sensor that didn't give a good reading last time stays due
+        return set(role for role in self.roles if self.next_due[role] <= now + 1e-6)
+
+    def update(self, now, readings): #Feeds back the good readings (role -> float) taken at this tick
+        for role, value in readings.items():
+            if role not in self.next_due:
+                continue
+            if role in self.previous:
+                then, last = self.previous[role]
+                if now > then:
+                    self.rates[role] = abs(value - last)/(now - then)
+            self.previous[role] = (now, value)
+            self.next_due[role] = now + self.interval(role)
+
+
+def default_stage_intervals(fast_period, slow_period):
+    #Stage 1 is all about the cold head and the pump, stage 2 about the mainplate, film burner and heat switch
+    return {0: {},
+            1: {'film_burner': slow_period, 'mainplate': slow_period, 'heat_switch': slow_period},
+            2: {'head': slow_period}}
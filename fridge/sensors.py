@@ -0,0 +1,205 @@
+#Sensor map for the SIM900 thermometers and the plan used to read them with as few CONN switches as possible
+
+import json
+from collections import OrderedDict
+from hardware import PortTimeout
+from .samples import Sample, parse_reply, NAN, OK, STALE, OVERLOAD
+from .clock import MonotonicClock
+
+class Sensor(object): #One thermometer - the SIM900 slot/channel it lives on, its log column name and its job in the cooldown
+    def __init__(self, slot, channel, name, role):
+        self.slot = str(slot)
+        self.channel = channel #None for single channel modules like the SIM921
+        self.name = name
+        self.role = role
+
+    def __repr__(self):
+        return 'Sensor({!r}, {!r}, {!r}, {!r})'.format(self.slot, self.channel, self.name, self.role)
+
+
+def default_sensor_map(ac_bridge_slot, therm_slot): #The standard GL4 wiring - CERNOX on the SIM921, four diodes on the SIM922
+    return [Sensor(ac_bridge_slot, None, 'c_head_temp(K)', 'head'),
+            Sensor(therm_slot, 1, 'film_burner_temp(K)', 'film_burner'),
+            Sensor(therm_slot, 2, 'mainplate_temp(K)', 'mainplate'),
+            Sensor(therm_slot, 3, 'he_pump_temp(K)', 'pump'),
+            Sensor(therm_slot, 4, 'heat_sw_temp(K)', 'heat_switch')]
+
+
+def load_sensor_map(path): #Reads a JSON list of {"slot":..., "channel":..., "name":..., "role":...}
+    with open(path) as map_file:
+        entries = json.load(map_file)
+    return [Sensor(entry['slot'], entry.get('channel'), entry['name'], entry['role']) for entry in entries]
+
+
+class SlotGroup(object): #All the sensors on one SIM900 slot, read back to back while the slot is connected
+    def __init__(self, slot, query):
+        self.slot = slot
+        self.query = query
+        self.sensors = []
+        self.single = [] #sensors the queries in flight are for
+        self.multi = []
+        self.sent = []
+        self.replies = []
+        self.started = None
+
+    def wanted(self, roles):
+        return any(s.role in roles for s in self.sensors)
+
+    def queried(self, sim900, roles):
+        #(single, multi) sensors the queries for these roles cover. One batched query reads every channel of a multi-channel
+        #module, so once any of them is due they all come back; without batching only the due channels are asked for.
+        single = [s for s in self.sensors if s.channel is None and s.role in roles]
+        multi = [s for s in self.sensors if s.channel is not None]
+        if not sim900.batch_support.get(self.slot, True):
+            multi = [s for s in multi if s.role in roles]
+        elif not any(s.role in roles for s in multi):
+            multi = []
+        return single, multi
+
+    def read(self, sim900, roles):
+        readings = {}
+        single, multi = self.queried(sim900, roles)
+        for sensor in single:
+            readings[sensor.role] = sim900.ask(self.slot, self.query)
+        if multi:
+            replies = sim900.ask_channels(self.slot, self.query, [s.channel for s in multi])
+            for sensor, reply in zip(multi, replies):
+                readings[sensor.role] = reply
+        return readings
+
+    def in_flight(self):
+        return self.started is not None
+
+    def start(self, sim900, now, roles): #Port mode - queues the queries for these roles in the module without waiting for the answers
+        single, multi = self.queried(sim900, roles)
+        self.single = single
+        self.multi = multi
+        self.batch = bool(multi) and sim900.batch_support.get(self.slot, True)
+        self.sent = [self.query for s in single]
+        if self.batch:
+            self.sent.append('{} 0'.format(self.query))
+        else:
+            self.sent += ['{} {}'.format(self.query, s.channel) for s in multi]
+        for query in self.sent:
+            sim900.send(self.slot, query)
+        self.replies = []
+        self.started = now
+
+    def collect(self, sim900): #Port mode - returns the readings once every reply is in, otherwise None
+        self.replies += sim900.collect(self.slot)
+        if len(self.replies) < len(self.sent):
+            return None
+        self.started = None
+        single = self.single
+        multi = self.multi
+        readings = dict((sensor.role, reply) for sensor, reply in zip(single, self.replies))
+        replies = self.replies[len(single):]
+        if self.batch:
+            replies = replies[0].split(',')
+            if len(replies) < max(s.channel for s in multi):
+                sim900.batch_support[self.slot] = False
+                return readings
+            replies = [replies[s.channel-1].strip() for s in multi]
+        for sensor, reply in zip(multi, replies):
+            readings[sensor.role] = reply
+        return readings
+
+    def abandon(self, sim900): #Port mode - gives up on replies that never came, a batch query that went unanswered isn't tried again
+        sim900.flush(self.slot)
+        if self.batch:
+            sim900.batch_support[self.slot] = False
+        self.started = None
+
+
+class AcquisitionPlan(object): #Groups the sensor map by slot and orders the groups so each cycle starts on the slot the last one finished on
+    def __init__(self, sensors, query='TVAL?', clock=None):
+        self.sensors = list(sensors)
+        self.clock = clock if clock is not None else MonotonicClock()
+        self.groups = OrderedDict()
+        for sensor in self.sensors:
+            if sensor.slot not in self.groups:
+                self.groups[sensor.slot] = SlotGroup(sensor.slot, query)
+            self.groups[sensor.slot].sensors.append(sensor)
+        self.names = [s.name for s in self.sensors]
+        self.roles = [s.role for s in self.sensors]
+        self.index = dict((role, i) for i, role in enumerate(self.roles))
+        self.last_switches = 0
+        self.last = {} #role -> last good value
+        self.fresh = {} #role -> status of the readings taken by the current call to read
+        self.repeats = dict((role, 0) for role in self.roles)
+        self.overload_repeats = 5 #identical SIM921 readings in a row before it is flagged as overloaded
+        self.sweep_timeout = 0.2 #seconds spent collecting port replies before carrying on with the previous values
+
+    def order(self, active_slot): #Slot groups in read order, starting with the slot that is already connected
+        groups = list(self.groups.values())
+        if active_slot in self.groups:
+            first = self.groups[active_slot]
+            groups.remove(first)
+            groups.insert(0, first)
+        return groups
+
+    def switches(self, active_slot, roles=None): #Number of CONN switches a cycle costs from this starting slot
+        roles = self.roles if roles is None else roles
+        slots = [g.slot for g in self.order(active_slot) if g.wanted(roles)]
+        return sum(1 for prev, slot in zip([active_slot] + slots, slots) if prev != slot)
+
+    def sensor(self, role):
+        return self.sensors[self.index[role]]
+
+    def read(self, sim900, t, roles=None):
+        #Reads the sensors with the given roles (all of them by default) and returns a Sample taken at time t. The other
+        #channels of a batched SIM922 query come back fresh too, as they cost nothing extra; sensors that weren't read this
+        #time carry their previous value flagged STALE.
+        roles = self.roles if roles is None else roles
+        self.fresh = {}
+        if getattr(sim900, 'mode', 'conn') == 'port':
+            self.read_ports(sim900, roles)
+        else:
+            active_slot = sim900.active_module
+            self.last_switches = self.switches(active_slot, roles)
+            for group in self.order(active_slot):
+                if group.wanted(roles):
+                    self.store(group.read(sim900, roles))
+        return Sample(t, self.index, tuple(self.last.get(role, NAN) for role in self.roles),
+                      tuple(self.fresh.get(role, STALE) for role in self.roles))
+
+    def store(self, readings): #Parses replies (role -> text) once, keeping the last good value of each sensor
+        for role, reply in readings.items():
+            value, status = parse_reply(reply)
+            if status == OK:
+                if self.sensor(role).channel is None and value == self.last.get(role):
+                    self.repeats[role] += 1
+                    if self.repeats[role] > self.overload_repeats:
+                        status |= OVERLOAD
+                        self.repeats[role] = 0
+                else:
+                    self.repeats[role] = 0
+                self.last[role] = value
+            self.fresh[role] = status
+
+    def read_ports(self, sim900, roles):
+        #Port mode - every module is sent its query up front and the replies are swept up together. A slow module (the SIM921)
+        #that hasn't answered by the end of the sweep keeps its query in flight and its previous value is reported instead.
+        self.last_switches = 0
+        for group in self.groups.values():
+            if not group.in_flight() and group.wanted(roles):
+                group.start(sim900, self.clock.now(), roles)
+        deadline = self.clock.now() + self.sweep_timeout
+        while True:
+            for group in self.groups.values():
+                if group.in_flight():
+                    readings = group.collect(sim900)
+                    if readings is not None:
+                        self.store(readings)
+                elif any(s.role not in self.last for s in group.sensors): #never read yet, eg a new sensor map
+                    group.start(sim900, self.clock.now(), [s.role for s in group.sensors if s.role not in self.last])
+            now = self.clock.now()
+            for group in self.groups.values():
+                if group.in_flight() and now - group.started > sim900.port_timeout:
+                    group.abandon(sim900)
+                    if any(s.role not in self.last for s in group.sensors):
+                        raise PortTimeout('No reply from SIM900 port {}'.format(group.slot))
+            waiting = [g for g in self.groups.values() if g.in_flight()]
+            if not waiting or (now > deadline and all(role in self.last for role in self.roles)):
+                break
+            self.clock.sleep(0.01)
@@ -0,0 +1,96 @@
+#Cooldown settings - everything the engine needs to run a cooldown, kept apart from the GUI so a headless run can load them
+#from a JSON profile
+
+import json
+
+DEFAULTS = [
+    #SIM900 Slots
+    ('ACBridgeSlot', '5'),
+    ('ThermSlot1', '8'),
+    #Optional JSON sensor map for extra thermometers, blank uses the slots above
+    ('sensor_map_file', ''),
+    #'conn' talks to one module at a time, 'port' uses the SIM900 port buffers so modules convert in parallel
+    ('SIM900_mode', 'conn'),
+    #Seconds between temperature samples
+    ('sample_period', 1.0),
+    #Slowest a flat sensor gets polled, set equal to the sample period to poll everything every time
+    ('slow_sample_period', 10.0),
+    #Samples kept at each level of detail of the live plot, each level covers 4x as long as the one below
+    ('plot_history', 3600),
+    #Seconds between reads of the supply's measured volts and amps, 0 for never
+    ('heater_readback_period', 10.0),
+    #For logging
+    ('log_file', 'temp_log.txt'),
+    ('logging', False),
+    ('log_per_run', False), #new log file for every cooldown
+    ('log_rotate_mb', 0), #start a new numbered log file at this size, 0 for never
+    ('log_fsync', 'never'), #'never', 'flush' or 'close'
+    ('log_format', 'csv'), #'csv' or 'binary' (see fridge/binlog.py)
+    ('log_flush_rows', 100),
+    ('log_flush_interval', 5.0),
+    #Thresholds to tinker with
+    ('CDStage1_ThHold', 4.2),
+    ('CDStage1_Pump_lower_temp', 45.0),
+    #Stage 1 pump temperature loop (the "pid" recipe step) - gains in W/K, W/(K s) and W s/K, power limit in W
+    ('pid_setpoint', 47.5),
+    ('pid_kp', 0.1),
+    ('pid_ki', 0.002),
+    ('pid_kd', 0.0),
+    ('pid_feedforward', 0.0), #power expected to hold the setpoint, 0 to leave it all to the loop
+    ('pid_max_power', 1.6), #25V into the pump heater
+    ('pid_heater_ohms', 400.0),
+    ('pid_log_file', ''), #CSV of error, output and loop latency every update, blank for none
+    #Stage 2 starts ramping the heat switch once the pump is cooling faster than this (K/s) and the heat switch is below
+    #this (K), or after the recipe's wait at the latest
+    ('stage2_pump_cooling_rate', 0.005),
+    ('stage2_heat_switch_temp', 10.0),
+    #Heater ramps and waits of the standard recipe (recipes/gl4.json), volts and seconds
+    ('stage1_ramp_volts', 25.0), #pump heater
+    ('stage1_ramp_time', 300.0),
+    ('stage2_wait', 300.0), #longest stage 2 waits for the pump to cool
+    ('hs_ramp_volts', 6.0), #heat switch heater
+    ('hs_ramp_time', 300.0),
+    #Heat switch adaptive ramp (the "adaptive_ramp" recipe step, see recipes/gl4_adaptive.json)
+    ('hs_step_volts', 0.5),
+    ('hs_settle_rate', 0.01), #K/s, the switch counts as having caught up with a step below this
+    ('hs_min_dwell', 20.0), #seconds at each voltage at least
+    ('hs_max_dwell', 60.0), #seconds at each voltage at most, so a flat reading can't stall the ramp
+    ('hs_max_power', 0.1), #W
+    ('hs_heater_ohms', 360.0), #used for the power limit until the supply's read back gives the real figure
+    ('hs_guard_max', 4.5), #K, mainplate above this backs the switch off
+    ('hs_guard_rate', 0.05), #K/s, and so does it warming faster than this - the switch closing on a warm pump alone warms it a few 0.01K/s
+    ('hs_backoff_volts', 1.0),
+    #Seconds of readings the recipe's cooling rate conditions fit a slope to
+    ('rate_window', 60.0),
+    #let the Keithley run heater ramps itself from its list mode if it has one
+    ('ramp_list_mode', True),
+    #JSON cooldown recipe (see fridge/recipe.py), blank for the standard GL4 one in recipes/gl4.json
+    ('recipe_file', ''),
+    #Longest a stop waits for the supply to confirm every output is off before reporting it unverified, seconds
+    ('stop_timeout', 5.0),
+]
+
+class Settings(object):
+    def __init__(self, **values):
+        for name, default in DEFAULTS:
+            setattr(self, name, default)
+        self.update(values)
+
+    def update(self, values): #Sets the given settings, unknown names are refused so a typo in a profile doesn't go unnoticed
+        names = set(name for name, default in DEFAULTS)
+        for name, value in values.items():
+            if name not in names:
+                raise KeyError('Unknown setting {!r}'.format(name))
+            setattr(self, name, value)
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name, default in DEFAULTS)
+
+    def save(self, path):
+        with open(path, 'w') as profile:
+            json.dump(self.as_dict(), profile, indent=2, sort_keys=True)
+
+    @classmethod
+    def load(cls, path): #Settings missing from the profile keep their defaults
+        with open(path) as profile:
+            return cls(**json.load(profile))
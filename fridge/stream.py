@@ -0,0 +1,79 @@
+#Sample stream - the reader publishes each Sample once and every subscriber wakes up for it, instead of polling a shared value
+
+import threading
+from .clock import MonotonicClock
+
+class StreamClosed(Exception):
+    pass
+
+
+class Subscription(object):
+    #One consumer's view of the stream. get() hands over each new sample exactly once; a consumer that falls behind only
+    #gets the newest one and the ones it skipped are counted in missed.
+    def __init__(self, stream):
+        self.stream = stream
+        self.cond = threading.Condition()
+        self.sample = None
+        self.acquired_at = None
+        self.seq = 0
+        self.seen = 0
+        self.missed = 0
+        self.closed = False
+
+    def put(self, sample, acquired_at):
+        with self.cond:
+            self.sample = sample
+            self.acquired_at = acquired_at
+            self.seq += 1
+            self.cond.notify_all()
+
+    def get(self, timeout=None): #Blocks until there is a sample this subscriber hasn't had, None on timeout (stream clock seconds)
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > self.seen or self.closed, self.stream.clock.real_seconds(timeout)):
+                return None
+            if self.closed:
+                raise StreamClosed()
+            self.missed += self.seq - self.seen - 1
+            self.seen = self.seq
+            return self.sample
+
+    def age(self): #Seconds since the last sample handed over was acquired
+        return self.stream.clock.now() - self.acquired_at
+
+    def close(self):
+        self.stream.unsubscribe(self)
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def __iter__(self):
+        try:
+            while True:
+                yield self.get()
+        except StreamClosed:
+            return
+
+
+class SampleStream(object): #Fans samples out to any number of subscribers
+    def __init__(self, clock=None):
+        self.clock = clock if clock is not None else MonotonicClock()
+        self.lock = threading.Lock()
+        self.subscribers = []
+
+    def subscribe(self):
+        subscription = Subscription(self)
+        with self.lock:
+            self.subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            if subscription in self.subscribers:
+                self.subscribers.remove(subscription)
+
+    def publish(self, sample, acquired_at=None): #acquired_at is the clock time the reads started, now if not given
+        acquired_at = self.clock.now() if acquired_at is None else acquired_at
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            subscription.put(sample, acquired_at)
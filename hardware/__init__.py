@@ -1 +1,3 @@
-from .stanfordresearchsystems import SIM900
+from .stanfordresearchsystems import SIM900, PortTimeout
+from .keithley import Keithley2230G
+from .instrument import VisaIOError, SystemClock
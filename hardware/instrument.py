@@ -1,11 +1,24 @@
-from visa import ResourceManager
+from time import sleep, monotonic
+try:
+	from visa import ResourceManager, VisaIOError
+except ImportError: #no PyVisa, only resource managers handed in (eg simulator.SimulatedResourceManager) can open anything
+	ResourceManager = None
+	class VisaIOError(IOError):
+		pass
+
+class SystemClock(object): #Real time. Anything else with now() and sleep(seconds) will do instead, eg fridge.clock.VirtualClock
+	def now(self):
+		return monotonic()
+	def sleep(self,seconds):
+		if seconds > 0:
+			sleep(seconds)
 
 class GenericInstrument(object):
-	def __init__(self,address):
+	def __init__(self,address,rm=None,clock=None):
 		self.address = address
+		self.rm = rm #anything with open_resource(address), a PyVisa ResourceManager if not given
+		self.clock = clock if clock is not None else SystemClock() #times the retries and waits
 		self.initialise()
-
-
 	def initialise(self):
-		rm = ResourceManager()
+		rm = self.rm if self.rm is not None else ResourceManager()
 		self.handle = rm.open_resource(self.address)
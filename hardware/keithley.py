@@ -0,0 +1,191 @@
+from .instrument import GenericInstrument, VisaIOError
+
+#Keithley 2230G triple output supply. Keeps a model of the selected channel, setpoints and output states so writes that
+#wouldn't change anything are skipped, and sends whatever is left as one SCPI string. resync() reads the real state back.
+#Voltage ramps can be handed to the supply's list mode (run_list) so it steps the voltage itself. Whether the supply takes
+#the LIST commands is checked against the error queue the first time, and list mode is left alone from then on if not.
+
+class Keithley2230G(GenericInstrument):
+	def __init__(self,address,channels=3,rm=None,clock=None):
+		self.channels = channels
+		self.resync_interval = 60 #seconds between read-backs, 0 to only resync when asked
+		self.list_mode = None #None until probed
+		self.list_steps = 80 #most steps a list can hold
+		super(Keithley2230G,self).__init__(address,rm,clock)
+
+
+	def initialise(self):
+		super(Keithley2230G,self).initialise()
+		self.handle.write('SYSTEM:REMOTE') #needed to work on pi/linux
+		self.invalidate()
+
+
+	def invalidate(self):
+		#Forget everything, the next write of each setting goes out regardless
+		self.selected = None
+		self.state = dict((channel,{'VOLT':None,'CURR':None,'CHAN:OUTP':None}) for channel in range(1,self.channels+1))
+		self.last_sync = None
+		self.skipped = 0
+
+
+	def write(self,text):
+		try:
+			self.handle.write(text)
+		except VisaIOError:
+			self.clock.sleep(1)
+			self.handle.write(text)
+
+
+	def ask(self,query):
+		try:
+			return self.handle.ask(query)
+		except VisaIOError:
+			self.clock.sleep(1)
+			return self.handle.ask(query)
+
+
+	def send(self,commands):
+		#One transaction, every command given its full path so the parser starts from the root each time
+		if commands:
+			self.write(';'.join(':'+command for command in commands))
+
+
+	def changes(self,channel,volt=None,curr=None,output=None,force=False):
+		#Commands needed to bring a channel to the given settings, None leaves a setting alone
+		wanted = []
+		if volt is not None:
+			wanted.append(('VOLT',float(volt),'VOLT {:.4f}'.format(volt)))
+		if curr is not None:
+			wanted.append(('CURR',float(curr),'CURR {:.4f}'.format(curr)))
+		if output is not None:
+			wanted.append(('CHAN:OUTP',bool(output),'CHAN:OUTP {}'.format('ON' if output else 'OFF')))
+		state = self.state[channel]
+		commands = []
+		for key,value,command in wanted:
+			if force or state[key] is None or (abs(state[key]-value) > 1e-6 if key != 'CHAN:OUTP' else state[key] != value):
+				commands.append((key,value,command))
+			else:
+				self.skipped += 1
+		return commands
+
+
+	def set(self,channel,volt=None,curr=None,output=None,force=False):
+		#Brings a channel to the given settings, skipping anything that is already there. Returns the SCPI string sent.
+		return self.apply([(channel,self.changes(channel,volt,curr,output,force))],force)
+
+
+	def apply(self,channel_changes,force=False):
+		commands = []
+		selected = self.selected
+		for channel,changes in channel_changes:
+			if changes and (force or selected != channel):
+				commands.append('INST:NSEL {}'.format(channel))
+				selected = channel
+			commands += [command for key,value,command in changes]
+		if not commands:
+			return ''
+		try:
+			self.send(commands)
+		except VisaIOError:
+			self.invalidate()
+			raise
+		self.selected = selected
+		for channel,changes in channel_changes:
+			for key,value,command in changes:
+				self.state[channel][key] = value
+		return ';'.join(commands)
+
+
+	def all_off(self):
+		#Every output to 0V and off in one go, never trusting the cache. Any running list is stopped first.
+		if self.list_mode:
+			self.send(['INST:NSEL {};:LIST:STAT OFF'.format(channel) for channel in range(1,self.channels+1)])
+			self.selected = self.channels
+		return self.apply([(channel,self.changes(channel,volt=0,output=False,force=True)) for channel in range(1,self.channels+1)],True)
+
+
+	def no_error(self):
+		return self.ask(':SYST:ERR?').strip().startswith(('0','+0'))
+
+
+	def has_list_mode(self):
+		if self.list_mode is None:
+			try:
+				self.no_error() #clears anything left in the error queue
+				self.ask(':LIST:STEP?')
+				self.list_mode = self.no_error()
+			except VisaIOError:
+				self.list_mode = False
+		return self.list_mode
+
+
+	def run_list(self,channel,volts,dwell):
+		#Programs and starts a one-shot list of voltages, dwell seconds each. Returns False if the supply refused it.
+		commands = ['INST:NSEL {}'.format(channel),'LIST:STEP {}'.format(len(volts))]
+		commands += ['LIST:VOLT {},{:.4f}'.format(i+1,volt) for i,volt in enumerate(volts)]
+		commands += ['LIST:WIDT {},{:.3f}'.format(i+1,dwell) for i in range(len(volts))]
+		commands += ['LIST:COUN 1','LIST:STAT ON']
+		self.selected = channel
+		self.state[channel]['VOLT'] = None #unknown until the list is done
+		try:
+			self.send(commands)
+			if self.no_error():
+				return True
+		except VisaIOError:
+			pass
+		self.list_mode = False
+		self.invalidate()
+		return False
+
+
+	def list_running(self,channel):
+		self.selected = channel
+		return self.ask(':INST:NSEL {};:LIST:STAT?'.format(channel)).strip() in ('1','ON')
+
+
+	def stop_list(self,channel):
+		self.send(['INST:NSEL {}'.format(channel),'LIST:STAT OFF'])
+		self.selected = channel
+
+
+	def resync(self):
+		#Reads the real selection, setpoints and output states back into the cache
+		try:
+			for channel in range(1,self.channels+1):
+				volt,curr,output = self.ask(':INST:NSEL {};:VOLT?;:CURR?;:CHAN:OUTP?'.format(channel)).split(';')
+				self.state[channel] = {'VOLT':float(volt),'CURR':float(curr),'CHAN:OUTP':output.strip() in ('1','ON')}
+			self.selected = self.channels
+		except (ValueError, VisaIOError):
+			self.invalidate()
+			return False
+		self.last_sync = self.clock.now()
+		return True
+
+
+	def maybe_resync(self):
+		if self.resync_interval and (self.last_sync is None or self.clock.now()-self.last_sync > self.resync_interval):
+			return self.resync()
+		return None
+
+
+	def still_on(self,max_volts=0.05):
+		#Reads back the setpoints, output states and measured voltages, returns the channels that aren't at 0V and off
+		self.resync()
+		measured = self.measure_all()
+		return [channel for channel in range(1,self.channels+1)
+		        if self.state[channel]['VOLT'] != 0 or self.state[channel]['CHAN:OUTP'] or measured[channel-1][0] > max_volts]
+
+
+	def measure_all(self):
+		#Measured (volts, amps) of every channel, both quantities for all channels in one transaction where the supply
+		#allows it, otherwise one query per quantity per channel
+		try:
+			volts,amps = self.ask(':MEAS:VOLT? ALL;:MEAS:CURR? ALL').split(';')
+			volts = [float(v) for v in volts.split(',')]
+			amps = [float(a) for a in amps.split(',')]
+			if len(volts) == len(amps) == self.channels:
+				return list(zip(volts,amps))
+		except (ValueError, VisaIOError):
+			pass
+		return [(float(self.ask(':MEAS:VOLT? CH{}'.format(channel))),float(self.ask(':MEAS:CURR? CH{}'.format(channel))))
+		        for channel in range(1,self.channels+1)]
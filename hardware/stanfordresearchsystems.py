@@ -1,12 +1,17 @@
-from .instrument import GenericInstrument
-from time import sleep
-from visa import VisaIOError
+from .instrument import GenericInstrument, VisaIOError
 
 #03/12/19 GT update: added retry capability in the event of visaIOError as found sometimes it times out and just needs a retry.
+#Port mode talks to the modules with SNDT and pulls the replies out of the mainframe's port buffers (NINP?/GETN?) instead of
+#CONNecting to one module at a time, so several modules can be converting at once.
+
+class PortTimeout(IOError): #Nothing turned up in a SIM900 port buffer in time
+	pass
 
 class SIM900(GenericInstrument):
-	def __init__(self,address):
-		super(SIM900,self).__init__(address)
+	def __init__(self,address,mode='conn',rm=None,clock=None):
+		self.mode = mode #'conn' for CONN pass-through, 'port' for SNDT/GETN via the port buffers
+		self.port_timeout = 5 #seconds to wait for a reply in port mode
+		super(SIM900,self).__init__(address,rm,clock)
 		self.handle.read_termination = '\r\n'
 
 
@@ -21,31 +26,56 @@ class SIM900(GenericInstrument):
 		self.prepend = ''
 		self.escstr = 'xyx'
 		self.active_module = None
+		self.batch_support = {}
+		self.port_buffers = {}
+		if self.mode == 'port':
+			self.handle.write('FLSH')
 
 
 	def ask(self,slot,query):
+		if self.mode == 'port':
+			self.send(slot,query)
+			return self.wait_for(slot)
 		self.switch_to(slot)
 		try:
 		    return self.handle.ask(query)
 		except VisaIOError:
-			sleep(1)
+			self.clock.sleep(1)
 			return self.handle.ask(query)
 
+	def ask_channels(self,slot,query,channels):
+		#Reads several channels of a multi-channel module (eg SIM922) in one transaction - channel 0 asks for all of them.
+		#Falls back to one query per channel if the module doesn't give back a reply for every channel.
+		if self.batch_support.get(slot, True):
+			try:
+				replies = self.ask(slot,'{} 0'.format(query)).split(',')
+			except (VisaIOError, PortTimeout):
+				replies = []
+			if len(replies) >= max(channels):
+				return [replies[channel-1].strip() for channel in channels]
+			self.batch_support[slot] = False
+		return [self.ask(slot,'{} {}'.format(query,channel)) for channel in channels]
+
 	def write(self,slot,text):
+		if self.mode == 'port':
+			self.send(slot,text)
+			return
 		self.switch_to(slot)
 		try:
 			self.handle.write(text)
 		except VisaIOError:
-			sleep(1)
+			self.clock.sleep(1)
 			self.handle.write(text)
 
 
 	def read(self,slot):
+		if self.mode == 'port':
+			return self.wait_for(slot)
 		self.switch_to(slot)
 		try:
 		    return self.handle.read()
 		except VisaIOError:
-			sleep(1)
+			self.clock.sleep(1)
 			return self.handle.read()
 
 
@@ -54,3 +84,72 @@ class SIM900(GenericInstrument):
 			self.handle.write('{}CONN {}, "{}"'.format(self.prepend,slot,self.escstr))
 			self.prepend = self.escstr
 			self.active_module = slot
+
+
+	def to_mainframe(self):
+		#Drops out of any CONN pass-through so the mainframe itself is listening
+		if self.prepend:
+			self.handle.write(self.escstr)
+			self.prepend = ''
+			self.active_module = None
+
+
+	def mainframe_write(self,text):
+		self.to_mainframe()
+		try:
+			self.handle.write(text)
+		except VisaIOError:
+			self.clock.sleep(1)
+			self.handle.write(text)
+
+
+	def mainframe_ask(self,query):
+		self.to_mainframe()
+		try:
+			return self.handle.ask(query)
+		except VisaIOError:
+			self.clock.sleep(1)
+			return self.handle.ask(query)
+
+
+	def send(self,slot,text):
+		#Queues a command in a module's input through the mainframe without connecting to it
+		self.mainframe_write('SNDT {},"{}"'.format(slot,text))
+
+
+	def collect(self,slot):
+		#Pulls whatever a module has put in its port buffer and returns any complete reply lines, partial lines are kept for next time
+		waiting = int(self.mainframe_ask('NINP? {}'.format(slot)))
+		buffered = self.port_buffers.get(slot,'')
+		if waiting:
+			buffered += self.get_block(slot,waiting)
+		lines = buffered.split('\r\n')
+		self.port_buffers[slot] = lines.pop()
+		return [line for line in lines if line]
+
+
+	def get_block(self,slot,count):
+		#GETN? answers with a definite length block, #<digits><length><data>, which can itself contain the module's CRLF
+		self.handle.write('GETN? {},{}'.format(slot,count))
+		header = self.handle.read_bytes(2).decode()
+		length = int(self.handle.read_bytes(int(header[1])).decode())
+		return self.handle.read_bytes(length+2).decode()[:length]
+
+
+	def wait_for(self,slot):
+		#Blocks until one reply line is available from a port
+		deadline = self.clock.now() + self.port_timeout
+		while True:
+			lines = self.collect(slot)
+			if lines:
+				if len(lines) > 1:
+					self.port_buffers[slot] = '\r\n'.join(lines[1:]) + '\r\n' + self.port_buffers[slot]
+				return lines[0]
+			if self.clock.now() > deadline:
+				raise PortTimeout('No reply from SIM900 port {}'.format(slot))
+			self.clock.sleep(0.01)
+
+
+	def flush(self,slot):
+		self.mainframe_write('FLSH {}'.format(slot))
+		self.port_buffers[slot] = ''
@@ -0,0 +1,2 @@
+from .model import GL4Model, Params
+from .instruments import SimulatedResourceManager, SimulatedSIM900, SimulatedKeithley2230G, SIM900_ADDRESS, KEITHLEY_ADDRESS, modules_for
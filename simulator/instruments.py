@@ -0,0 +1,234 @@
+#Simulated VISA resources for the SIM900 (with a SIM921 and SIM922 in it) and the Keithley 2230G, answering from a
+#GL4Model. They take the same write/ask/read/read_bytes/clear calls as the PyVisa resources the hardware classes use, so
+#hardware.SIM900 and hardware.Keithley2230G drive them unchanged - hand a SimulatedResourceManager to them (or to
+#CooldownEngine.open_devices) where PyVisa's ResourceManager would be used.
+#
+#The model is advanced to the clock's time before every command, so the speed only changes how fast the simulated fridge
+#evolves, not how much work a read costs. Give it the engine's clock (fridge/clock.py) so the two agree on the time.
+
+import random
+import re
+from hardware.instrument import VisaIOError
+from fridge.clock import ScaledClock
+from .model import GL4Model
+
+SIM900_ADDRESS = 'SIM::SIM900::INSTR'
+KEITHLEY_ADDRESS = 'SIM::KEITHLEY2230G::INSTR'
+
+#VISA status codes the errors carry, as PyVisa's VisaIOError expects
+TIMEOUT = -1073807339
+NOT_FOUND = -1073807343
+
+#slot -> (module, roles by channel), the standard GL4 wiring from fridge.sensors.default_sensor_map
+DEFAULT_MODULES = {'5': ('SIM921', ['head']),
+                   '8': ('SIM922', ['film_burner', 'mainplate', 'pump', 'heat_switch'])}
+
+def modules_for(sensors): #Module layout for a fridge sensor map, so a custom map reads back something
+    modules = {}
+    for sensor in sensors:
+        if sensor.channel is None:
+            modules[sensor.slot] = ('SIM921', [sensor.role])
+        else:
+            kind, roles = modules.setdefault(sensor.slot, ('SIM922', []))
+            roles.extend([None]*(sensor.channel - len(roles)))
+            roles[sensor.channel-1] = sensor.role
+    return modules
+
+
+class SimulatedResource(object): #What the resources have in common - a queue of reply lines read back one at a time
+    def __init__(self, model, clock):
+        self.model = model
+        self.clock = clock
+        self.read_termination = '\n'
+        self.timeout = 2000
+        self.replies = []
+
+    def clear(self):
+        self.replies = []
+
+    def read(self):
+        self.model.advance(self.clock.now())
+        if not self.replies:
+            raise VisaIOError(TIMEOUT) #what a real read with nothing asked does
+        return self.replies.pop(0)
+
+    def ask(self, query):
+        self.write(query)
+        return self.read()
+
+    query = ask
+
+    def close(self):
+        pass
+
+
+class SimulatedSIM900(SimulatedResource):
+    #Mainframe commands: *CLS, *IDN?, CONN (left with the escape string), SNDT, NINP?, GETN? and FLSH. The modules answer
+    #TVAL? (SIM922: TVAL? n, 0 for every channel) and *IDN?, and take anything else (eg AGAI ON) without a reply.
+    #noise is the relative scatter on the readings, so a steady SIM921 doesn't look stuck to the overload check.
+    def __init__(self, model, clock, modules=None, noise=1e-4, seed=None):
+        super(SimulatedSIM900, self).__init__(model, clock)
+        self.read_termination = '\r\n'
+        self.modules = dict(DEFAULT_MODULES if modules is None else modules)
+        self.noise = noise
+        self.random = random.Random(seed)
+        self.connected = None #slot in CONN pass-through, None for the mainframe
+        self.escape = None
+        self.ports = dict((slot, '') for slot in self.modules) #port output buffers, filled by SNDT
+        self.block = b'' #GETN? reply, read with read_bytes
+
+    def write(self, text):
+        self.model.advance(self.clock.now())
+        if self.connected is not None:
+            if not text.startswith(self.escape):
+                reply = self.module(self.connected, text)
+                if reply is not None:
+                    self.replies.append(reply)
+                return
+            self.connected = None
+            text = text[len(self.escape):]
+            if not text:
+                return
+        self.mainframe(text.strip())
+
+    def mainframe(self, text):
+        command = text.split(' ', 1)
+        name, args = command[0].upper(), command[1] if len(command) > 1 else ''
+        if name == '*CLS':
+            self.replies = []
+        elif name == '*IDN?':
+            self.replies.append('Stanford_Research_Systems,SIM900,s/n000000,ver3.6')
+        elif name == 'CONN':
+            slot, escape = re.match(r'\s*(\d+)\s*,\s*"([^"]*)"', args).groups()
+            self.connected = slot
+            self.escape = escape
+        elif name == 'SNDT':
+            slot, query = re.match(r'\s*(\d+)\s*,\s*"([^"]*)"', args).groups()
+            reply = self.module(slot, query)
+            if reply is not None:
+                self.ports[slot] = self.ports.get(slot, '') + reply + '\r\n'
+        elif name == 'NINP?':
+            self.replies.append(str(len(self.ports.get(args.strip(), ''))))
+        elif name == 'GETN?':
+            slot, count = [arg.strip() for arg in args.split(',')]
+            buffered = self.ports.get(slot, '')
+            data, self.ports[slot] = buffered[:int(count)], buffered[int(count):]
+            length = str(len(data))
+            self.block += '#{}{}{}\r\n'.format(len(length), length, data).encode()
+        elif name == 'FLSH':
+            for slot in ([args.strip()] if args.strip() else list(self.ports)):
+                self.ports[slot] = ''
+
+    def module(self, slot, text): #A module's reply to a command, None if it doesn't give one
+        if slot not in self.modules:
+            return None
+        kind, roles = self.modules[slot]
+        command = text.strip().split(' ', 1)
+        name = command[0].upper()
+        if name == '*IDN?':
+            return 'Stanford_Research_Systems,{},s/n000000,ver2.0'.format(kind)
+        if name != 'TVAL?':
+            return None
+        if kind == 'SIM921':
+            return self.reading(roles[0])
+        channel = int(command[1]) if len(command) > 1 else 0
+        if channel == 0:
+            return ','.join(self.reading(role) for role in roles)
+        return self.reading(roles[channel-1] if channel <= len(roles) else None)
+
+    def reading(self, role):
+        return '{:+.6E}'.format(self.model.temperature(role)*(1 + self.random.gauss(0, self.noise)))
+
+    def read_bytes(self, count):
+        data, self.block = self.block[:count], self.block[count:]
+        if len(data) < count:
+            raise VisaIOError(TIMEOUT)
+        return data
+
+
+class SimulatedKeithley2230G(SimulatedResource):
+    #The subset of SCPI the driver sends: INST:NSEL, VOLT, CURR, CHAN:OUTP (and their queries), MEAS:VOLT?/MEAS:CURR? for
+    #one channel or ALL, SYST:ERR? and SYSTEM:REMOTE, several to a line separated by ';'. Anything else, the LIST
+    #commands included, goes on the error queue as an undefined header - the driver then ramps from the host.
+    #The outputs are constant voltage up to the current limit, then constant current.
+    def __init__(self, model, clock, channels=3):
+        super(SimulatedKeithley2230G, self).__init__(model, clock)
+        self.channels = dict((channel, {'VOLT': 0.0, 'CURR': 1.5, 'CHAN:OUTP': False}) for channel in range(1, channels+1))
+        self.selected = 1
+        self.errors = []
+
+    def write(self, text):
+        self.model.advance(self.clock.now())
+        replies = [reply for reply in (self.command(command.strip().lstrip(':')) for command in text.split(';')) if reply is not None]
+        if replies:
+            self.replies.append(';'.join(replies))
+
+    def command(self, text):
+        command = text.split(' ', 1)
+        name, args = command[0].upper(), command[1].strip().upper() if len(command) > 1 else ''
+        state = self.channels[self.selected]
+        if name in ('SYSTEM:REMOTE', 'SYST:REM'):
+            return None
+        if name == '*CLS':
+            self.errors = []
+            return None
+        if name == '*IDN?':
+            return 'Keithley instruments, 2230G-30-3, 0000000, 1.00-1.00'
+        if name == 'INST:NSEL':
+            self.selected = int(args)
+        elif name == 'INST:NSEL?':
+            return str(self.selected)
+        elif name in ('VOLT', 'CURR'):
+            state[name] = float(args)
+        elif name in ('VOLT?', 'CURR?'):
+            return '{:.4f}'.format(state[name[:-1]])
+        elif name == 'CHAN:OUTP':
+            state[name] = args in ('ON', '1')
+        elif name == 'CHAN:OUTP?':
+            return '1' if state['CHAN:OUTP'] else '0'
+        elif name in ('MEAS:VOLT?', 'MEAS:CURR?'):
+            index = 0 if name == 'MEAS:VOLT?' else 1
+            if args == 'ALL':
+                return ', '.join('{:.4f}'.format(self.output(channel)[index]) for channel in sorted(self.channels))
+            return '{:.4f}'.format(self.output(int(args[2:]) if args.startswith('CH') else self.selected)[index])
+        elif name == 'SYST:ERR?':
+            return self.errors.pop(0) if self.errors else '0,"No error"'
+        else:
+            self.errors.append('-113,"Undefined header"')
+            return None
+        self.update()
+        return None
+
+    def output(self, channel): #(volts, amps) actually on an output
+        state = self.channels[channel]
+        if not state['CHAN:OUTP']:
+            return 0.0, 0.0
+        ohms = self.model.resistance(channel)
+        if ohms is None: #nothing connected
+            return state['VOLT'], 0.0
+        amps = min(state['VOLT']/ohms, state['CURR'])
+        return amps*ohms, amps
+
+    def update(self): #Passes the output voltages on to the heaters
+        for channel in self.channels:
+            self.model.set_volts(channel, self.output(channel)[0])
+
+
+class SimulatedResourceManager(object):
+    #Opens the simulated SIM900 and Keithley on a shared GL4Model. speed is how many times faster than real time the model
+    #runs, or pass a clock to drive it from that instead - the engine's, eg a VirtualClock.
+    def __init__(self, model=None, speed=1.0, clock=None, modules=None, seed=None):
+        self.model = model if model is not None else GL4Model()
+        self.clock = clock if clock is not None else ScaledClock(speed)
+        self.modules = modules
+        self.seed = seed
+
+    def list_resources(self):
+        return (SIM900_ADDRESS, KEITHLEY_ADDRESS)
+
+    def open_resource(self, address, **kwargs):
+        if address == SIM900_ADDRESS:
+            return SimulatedSIM900(self.model, self.clock, self.modules, seed=self.seed)
+        if address == KEITHLEY_ADDRESS:
+            return SimulatedKeithley2230G(self.model, self.clock)
+        raise VisaIOError(NOT_FOUND)
@@ -0,0 +1,147 @@
+#Lumped thermal model of a GL4 sorption fridge on a cryocooler mainplate. Five nodes (head, film burner, mainplate, pump,
+#heat switch) each with one heat capacity, joined by conductances, plus the helium: gas while the pump is hot, liquid in
+#the head once it has condensed, and a pumping term that cools the head while the pump is cold and there is liquid left.
+#The numbers are picked to give GL4-like behaviour and timescales (a recycle in well under an hour, a day or so of hold
+#time), they are not fitted to any particular fridge. Everything is in SI units, temperatures in K and powers in W.
+
+import math
+import threading
+
+class Params(object): #Model constants, any of them can be overridden by keyword
+    DEFAULTS = [
+        #heat capacities, J/K
+        ('c_head', 0.05),
+        ('c_film_burner', 0.02),
+        ('c_mainplate', 5.0),
+        ('c_pump', 10.0),
+        ('c_heat_switch', 0.2),
+        #cryocooler - takes cooler_slope W/K out of the mainplate above cooler_temp
+        ('cooler_temp', 3.2),
+        ('cooler_slope', 1.0),
+        #conductances to the mainplate, W/K
+        ('g_head', 5e-6), #supports, sets the hold time
+        ('g_film_burner', 5e-6),
+        ('g_heat_switch', 0.006), #heat switch getter to the mainplate, sets how warm the switch heater gets it
+        ('g_switch_off', 0.002), #pump to mainplate with the heat switch open
+        ('g_switch_on', 0.05), #extra with the heat switch closed
+        ('g_head_film_burner', 5e-4),
+        #heat switch closes around switch_temp, over a width of switch_width
+        ('switch_temp', 12.0),
+        ('switch_width', 1.0),
+        #helium - desorbed from the pump above desorb_temp (all of it desorb_width higher), pumped by it below
+        #pump_temp (fully pump_width lower)
+        ('desorb_temp', 20.0),
+        ('desorb_width', 20.0),
+        ('pump_temp', 20.0),
+        ('pump_width', 10.0),
+        ('g_gas', 0.02), #head to mainplate through the desorbed gas
+        ('gas_load', 0.01), #W into the head from gas condensing on it
+        ('condense_temp', 5.0), #head has to be below this for liquid to collect
+        ('fill_time', 900.0), #s, time constant of the liquid collecting with all the gas out
+        ('base_temp', 0.35),
+        ('evaporation', 0.02), #W/K, cooling power per K above base_temp with the pump fully pumping
+        ('liquid_energy', 3.0), #J of cooling a full charge of liquid gives before it has all gone
+        #integration step, s
+        ('max_step', 0.25),
+    ]
+
+    def __init__(self, **values):
+        names = set(name for name, default in self.DEFAULTS)
+        for name, default in self.DEFAULTS:
+            setattr(self, name, default)
+        for name, value in values.items():
+            if name not in names:
+                raise KeyError('Unknown model parameter {!r}'.format(name))
+            setattr(self, name, value)
+
+
+#Supply channel -> (node it heats, heater resistance in ohms). Channel 3 isn't wired to anything
+HEATERS = {1: ('pump', 400.0), 2: ('heat_switch', 360.0)}
+
+#Where a recycle starts from - everything sitting on a cold mainplate, the liquid from the last cycle used up
+START = {'head': 4.8, 'film_burner': 4.5, 'mainplate': 3.5, 'pump': 4.0, 'heat_switch': 3.5}
+
+def fraction(x): #Clamped to 0..1
+    return min(max(x, 0.0), 1.0)
+
+
+class GL4Model(object):
+    #advance(t) integrates up to time t (seconds, any origin as long as it doesn't go backwards) with the heater voltages
+    #last set. Thread safe - the simulated SIM900 and Keithley each run on their own I/O thread.
+    def __init__(self, params=None, start=None, heaters=None):
+        self.params = params if params is not None else Params()
+        self.temps = dict(START)
+        self.temps.update(start or {})
+        self.heaters = dict(HEATERS if heaters is None else heaters)
+        self.volts = dict((channel, 0.0) for channel in self.heaters) #volts across each heater
+        self.liquid = 0.0 #fraction of a full charge condensed in the head
+        self.t = None
+        self.lock = threading.Lock()
+
+    def temperature(self, role): #Thermometers on anything the model doesn't have read the mainplate
+        with self.lock:
+            return self.temps.get(role, self.temps['mainplate'])
+
+    def resistance(self, channel): #None for a channel with no heater on it
+        heater = self.heaters.get(channel)
+        return heater[1] if heater is not None else None
+
+    def set_volts(self, channel, volts):
+        with self.lock:
+            if channel in self.volts:
+                self.volts[channel] = volts
+
+    def power(self, node):
+        return sum(self.volts[channel]**2/ohms for channel, (heated, ohms) in self.heaters.items() if heated == node)
+
+    def hold_time(self): #Seconds the liquid left would last against the heat leaking into the head and film burner now
+        with self.lock:
+            p = self.params
+            T = self.temps
+            leak = p.g_head*(T['mainplate'] - T['head']) + p.g_film_burner*(T['mainplate'] - T['film_burner'])
+            return self.liquid*p.liquid_energy/leak if leak > 0 else float('inf')
+
+    def switch(self): #How closed the heat switch is, 0..1
+        p = self.params
+        return 1.0/(1.0 + math.exp(-(self.temps['heat_switch'] - p.switch_temp)/p.switch_width))
+
+    def advance(self, t):
+        with self.lock:
+            if self.t is None: #the first call only sets the time origin
+                self.t = t
+            if t <= self.t:
+                return
+            span = t - self.t
+            steps = int(math.ceil(span/self.params.max_step))
+            powers = dict((node, self.power(node)) for node in self.temps)
+            for i in range(steps):
+                self.step(span/steps, powers)
+            self.t = t
+
+    def step(self, dt, powers):
+        p = self.params
+        T = self.temps
+        mp = T['mainplate']
+        gas = fraction((T['pump'] - p.desorb_temp)/p.desorb_width)
+        pumping = fraction((p.pump_temp - T['pump'])/p.pump_width)
+        g_pump = p.g_switch_off + p.g_switch_on*self.switch()
+        #heat flowing into each node
+        to_pump = g_pump*(mp - T['pump'])
+        to_switch = p.g_heat_switch*(mp - T['heat_switch'])
+        to_head = (p.g_head + p.g_gas*gas)*(mp - T['head']) + p.g_head_film_burner*(T['film_burner'] - T['head'])
+        to_head += p.gas_load*gas*(1.0 - self.liquid)
+        to_burner = p.g_film_burner*(mp - T['film_burner']) + p.g_head_film_burner*(T['head'] - T['film_burner'])
+        cooling = 0.0
+        if self.liquid > 0:
+            cooling = p.evaporation*pumping*max(T['head'] - p.base_temp, 0.0)
+        to_mainplate = -(to_pump + to_switch + (p.g_head + p.g_gas*gas)*(mp - T['head']) + p.g_film_burner*(mp - T['film_burner']))
+        to_mainplate -= p.cooler_slope*(mp - p.cooler_temp)
+        #liquid collects while the gas is out and the head is cold enough, and is used up by the pumping
+        if T['head'] < p.condense_temp:
+            self.liquid += gas*(1.0 - self.liquid)*dt/p.fill_time
+        self.liquid = max(self.liquid - cooling*dt/p.liquid_energy, 0.0)
+        T['pump'] += (to_pump + powers['pump'])*dt/p.c_pump
+        T['heat_switch'] += (to_switch + powers['heat_switch'])*dt/p.c_heat_switch
+        T['head'] += (to_head - cooling + powers['head'])*dt/p.c_head
+        T['film_burner'] += (to_burner + powers['film_burner'])*dt/p.c_film_burner
+        T['mainplate'] += (to_mainplate + powers['mainplate'])*dt/p.c_mainplate
@@ -0,0 +1,167 @@
+#Settings sweeps on the simulated GL4 - runs a cooldown for every combination of settings on a virtual clock, spread over a
+#process pool, ranks them and saves the best as a settings profile:
+#
+#  python -m simulator.optimise [--search grid|random] [--param NAME=LOW:HIGH[:POINTS]] ... [--jobs N] [--out best.json]
+#
+#Each run goes from the start of a recycle until the head has been below --base-temp for --settle hours, or gives up after
+#--limit hours. The hold time is then predicted from the liquid left and the heat leaking into the head rather than
+#simulated to the end, which would cost about ten times as much. Runs are ranked on hold - weight*time to base, in hours.
+#Every run uses the same thermometer noise, so the differences between runs are down to the settings.
+#
+#A grid search runs every combination of POINTS values of each parameter. A random search runs --rounds rounds of --samples
+#runs, the first drawn from the whole of each range and each round after that from ranges half as wide around the best run
+#so far.
+
+import argparse
+import itertools
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from fridge.settings import Settings
+from fridge.engine import CooldownEngine
+from fridge.clock import VirtualClock
+from fridge import analysis
+from .model import GL4Model
+from .instruments import SimulatedResourceManager, SIM900_ADDRESS, KEITHLEY_ADDRESS, modules_for
+
+#Settings swept when no --param is given, (name, low, high)
+SPACE = [('CDStage1_ThHold', 3.8, 4.6),
+         ('CDStage1_Pump_lower_temp', 40.0, 48.0),
+         ('pid_setpoint', 42.0, 52.0),
+         ('stage1_ramp_volts', 20.0, 28.0),
+         ('stage1_ramp_time', 120.0, 600.0),
+         ('stage2_wait', 60.0, 600.0),
+         ('hs_ramp_volts', 4.0, 8.0),
+         ('hs_ramp_time', 60.0, 600.0)]
+
+def simulate(values, base, base_temp=0.5, settle=1.0, limit=8.0, seed=0):
+    #One simulated cooldown with the settings in values on top of the base profile (a dict of settings), returns values
+    #with the figures of the run added - base_h and hold_h are None if it never got to base
+    settings = Settings(**base)
+    settings.update(values)
+    settings.logging = False
+    settings.pid_log_file = ''
+    clock = VirtualClock()
+    model = GL4Model()
+    rm = SimulatedResourceManager(model, clock=clock, seed=seed)
+    engine = CooldownEngine(settings, clock)
+    rm.modules = modules_for(engine.sensor_map())
+    engine.open_devices(KEITHLEY_ADDRESS, SIM900_ADDRESS, rm)
+    base_at = []
+    def watch(sample):
+        if not base_at and sample.fresh('head') and sample['head'] < base_temp:
+            base_at.append(sample.t)
+    engine.listeners.append(watch)
+    engine.start()
+    try:
+        engine.run_until(lambda engine: bool(base_at) and engine.scheduler.elapsed() >= base_at[0] + settle*3600, limit*3600)
+    finally:
+        report = engine.stop()
+        engine.close_devices()
+    result = dict(values)
+    result['base_h'] = base_at[0]/3600 if base_at else None
+    result['hold_h'] = settle + model.hold_time()/3600 if base_at else None #hours at base in all
+    result['stop_verified'] = report.verified()
+    return result
+
+
+def score(result, weight):
+    if result['base_h'] is None:
+        return float('-inf')
+    return result['hold_h'] - weight*result['base_h']
+
+
+def grid(space):
+    #space is (name, low, high, points)
+    axes = [[low + i*(high - low)/(points - 1) for i in range(points)] if points > 1 else [low] for name, low, high, points in space]
+    return [dict(zip([s[0] for s in space], combination)) for combination in itertools.product(*axes)]
+
+
+def draw(space, count, rng, around=None, shrink=1.0):
+    #count random points, uniform over the ranges or over ranges shrink times as wide centred on around (kept inside them)
+    points = []
+    for i in range(count):
+        point = {}
+        for name, low, high, steps in space:
+            if around is None:
+                point[name] = rng.uniform(low, high)
+            else:
+                half = (high - low)*shrink/2
+                centre = min(max(around[name], low + half), high - half)
+                point[name] = rng.uniform(centre - half, centre + half)
+        points.append(point)
+    return points
+
+
+def parse_param(text): #NAME=LOW:HIGH[:POINTS]
+    name, span = text.split('=', 1)
+    parts = span.split(':')
+    if len(parts) not in (2, 3):
+        raise argparse.ArgumentTypeError('expected NAME=LOW:HIGH[:POINTS], got {!r}'.format(text))
+    return name, float(parts[0]), float(parts[1]), int(parts[2]) if len(parts) == 3 else None
+
+
+def print_table(results, columns, weight, out=sys.stdout, as_csv=False): #Ranked, with each run's score
+    ranked = [dict(result, rank=i + 1, score=score(result, weight)) for i, result in enumerate(results)]
+    analysis.print_table(ranked, out, as_csv, ['rank', 'score'] + columns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m simulator.optimise', description='Sweep cooldown settings on the simulated GL4')
+    parser.add_argument('--param', action='append', type=parse_param, help='setting to sweep, NAME=LOW:HIGH[:POINTS], repeat for more')
+    parser.add_argument('--search', choices=('grid', 'random'), default='random')
+    parser.add_argument('--points', type=int, default=3, help='grid values per parameter when the --param doesn\'t say')
+    parser.add_argument('--samples', type=int, default=64, help='random runs per round')
+    parser.add_argument('--rounds', type=int, default=3, help='random search rounds')
+    parser.add_argument('--settings', help='JSON settings profile the sweep starts from')
+    parser.add_argument('--recipe', help='JSON cooldown recipe, the standard GL4 one if not given')
+    parser.add_argument('--base-temp', type=float, default=0.5, help='head temperature counted as base (K)')
+    parser.add_argument('--settle', type=float, default=1.0, help='hours at base before the hold is predicted')
+    parser.add_argument('--limit', type=float, default=8.0, help='simulated hours before a run that hasn\'t got to base is given up')
+    parser.add_argument('--weight', type=float, default=1.0, help='hours of hold an hour less to base is worth')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='simulations run in parallel')
+    parser.add_argument('--top', type=int, default=10, help='runs listed')
+    parser.add_argument('--csv', help='write every run to this CSV file')
+    parser.add_argument('--out', default='optimised_profile.json', help='settings profile the best run is saved to')
+    args = parser.parse_args(argv)
+
+    base = Settings.load(args.settings) if args.settings else Settings()
+    if args.recipe:
+        base.recipe_file = args.recipe
+    space = [(name, low, high, points if points is not None else args.points) for name, low, high, points in (args.param or [(s[0], s[1], s[2], None) for s in SPACE])]
+    Settings().update(dict((name, low) for name, low, high, points in space)) #refuses a misspelt setting before anything runs
+    run = partial(simulate, base=base.as_dict(), base_temp=args.base_temp, settle=args.settle, limit=args.limit, seed=args.seed)
+    rng = random.Random(args.seed)
+    key = lambda result: score(result, args.weight)
+    results = []
+    with ProcessPoolExecutor(args.jobs) as pool:
+        if args.search == 'grid':
+            batches = [grid(space)]
+        else:
+            batches = [draw(space, args.samples, rng)]
+        while batches:
+            points = batches.pop()
+            sys.stderr.write('{} runs on {} processes\n'.format(len(points), args.jobs))
+            results += pool.map(run, points, chunksize=max(1, len(points)//(4*args.jobs)))
+            rounds = len(results)//args.samples
+            if args.search == 'random' and rounds < args.rounds:
+                best = max(results, key=key)
+                batches.append(draw(space, args.samples, rng, best, 0.5**rounds))
+    results.sort(key=key, reverse=True)
+    columns = [s[0] for s in space] + ['base_h', 'hold_h', 'stop_verified']
+    print_table(results[:args.top], columns, args.weight)
+    if args.csv:
+        with open(args.csv, 'w') as csv_file:
+            print_table(results, columns, args.weight, csv_file, as_csv=True)
+    best = results[0]
+    if best['base_h'] is None:
+        sys.exit('No run got to base, nothing saved')
+    base.update(dict((s[0], best[s[0]]) for s in space))
+    base.save(args.out)
+    print('best settings saved to {}'.format(args.out))
+
+if __name__ == '__main__':
+    main()